@@ -0,0 +1,131 @@
+"""partition orders and deliveries by created_at
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.partitions import ensure_partitions, is_partitioned
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+ORDERS_COLUMNS = (
+    "id, user_id, category, status, description, weight, delivery_address, "
+    "delivery_time, comment, price, created_at, updated_at"
+)
+DELIVERIES_COLUMNS = (
+    "id, order_id, drone_id, status, estimated_arrival, actual_arrival, created_at, updated_at"
+)
+
+
+def _table_exists(conn, table: str) -> bool:
+    return conn.execute(sa.text("SELECT to_regclass(:table) IS NOT NULL"), {"table": table}).scalar()
+
+
+def _partition_table(conn, table: str, columns: str, create_sql: str, indexes):
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    for constraint in conn.execute(sa.text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype IN ('p', 'u', 'f')"
+    ), {"table": f"{table}_legacy"}).scalars():
+        op.execute(f'ALTER TABLE {table}_legacy DROP CONSTRAINT "{constraint}"')
+    for index in conn.execute(sa.text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+    ), {"table": f"{table}_legacy"}).scalars():
+        op.execute(f'DROP INDEX "{index}"')
+    op.execute(create_sql)
+    for index_sql in indexes:
+        op.execute(index_sql)
+
+    oldest = conn.execute(sa.text(f"SELECT min(created_at) FROM {table}_legacy")).scalar()
+    ensure_partitions(conn, since=oldest or datetime.now(timezone.utc))
+
+    op.execute(f"UPDATE {table}_legacy SET created_at = now() WHERE created_at IS NULL")
+    op.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_legacy")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"SELECT setval('{table}_id_seq', GREATEST((SELECT max(id) FROM {table}), 1))")
+    op.execute(f"DROP TABLE {table}_legacy")
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if not _table_exists(conn, "orders") or is_partitioned(conn, "orders"):
+        return
+
+    _partition_table(
+        conn,
+        "deliveries",
+        DELIVERIES_COLUMNS,
+        """
+        CREATE TABLE deliveries (
+            id INTEGER NOT NULL DEFAULT nextval('deliveries_id_seq'),
+            order_id INTEGER NOT NULL,
+            drone_id VARCHAR,
+            status VARCHAR,
+            estimated_arrival TIMESTAMP WITH TIME ZONE,
+            actual_arrival TIMESTAMP WITH TIME ZONE,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        [
+            "CREATE INDEX ix_deliveries_id ON deliveries (id)",
+            "CREATE INDEX ix_deliveries_order_id ON deliveries (order_id)",
+        ],
+    )
+    _partition_table(
+        conn,
+        "orders",
+        ORDERS_COLUMNS,
+        """
+        CREATE TABLE orders (
+            id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            category VARCHAR NOT NULL,
+            status VARCHAR,
+            description TEXT,
+            weight NUMERIC(5, 2),
+            delivery_address VARCHAR NOT NULL,
+            delivery_time VARCHAR,
+            comment TEXT,
+            price NUMERIC(10, 2) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        [
+            "CREATE INDEX ix_orders_id ON orders (id)",
+            "CREATE INDEX ix_orders_user_created ON orders (user_id, created_at)",
+            "CREATE INDEX ix_orders_status_created ON orders (status, created_at)",
+        ],
+    )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if not _table_exists(conn, "orders") or not is_partitioned(conn, "orders"):
+        return
+
+    for table, columns in (("orders", ORDERS_COLUMNS), ("deliveries", DELIVERIES_COLUMNS)):
+        op.execute(f"CREATE TABLE {table}_plain (LIKE {table} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table}_plain ({columns}) SELECT {columns} FROM {table}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}_plain.id")
+        op.execute(f"DROP TABLE {table} CASCADE")
+        op.execute(f"ALTER TABLE {table}_plain RENAME TO {table}")
+        op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+        op.execute(f"CREATE INDEX ix_{table}_id ON {table} (id)")
+
+    op.execute("ALTER TABLE orders ADD FOREIGN KEY (user_id) REFERENCES users (id)")
+    op.execute("ALTER TABLE deliveries ADD CONSTRAINT deliveries_order_id_key UNIQUE (order_id)")
+    op.execute("ALTER TABLE deliveries ADD FOREIGN KEY (order_id) REFERENCES orders (id)")
@@ -0,0 +1,42 @@
+"""unique index on lower(users.email)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    duplicates = conn.execute(sa.text(
+        "SELECT lower(email) FROM users GROUP BY lower(email) HAVING count(*) > 1 LIMIT 10"
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            "В users есть email, отличающиеся только регистром; объедините эти учётные записи "
+            f"и повторите миграцию: {', '.join(duplicates)}"
+        )
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс,
+    # который IF NOT EXISTS иначе принял бы за готовый
+    invalid = conn.execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = 'uq_users_email_lower' AND NOT i.indisvalid"
+    )).scalar()
+    with op.get_context().autocommit_block():
+        if invalid:
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_users_email_lower")
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_users_email_lower ON users (lower(email))")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_users_email_lower")
@@ -0,0 +1,42 @@
+"""multi-drop trips
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "trips",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("drone_id", sa.String(), nullable=False),
+        sa.Column("status", sa.String()),
+        sa.Column("stop_count", sa.Integer(), nullable=False),
+        sa.Column("distance_km", sa.Numeric(8, 2)),
+        sa.Column("payload_kg", sa.Numeric(6, 2)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("completed_at", sa.DateTime(timezone=True)),
+        if_not_exists=True,
+    )
+    op.create_index("ix_trips_id", "trips", ["id"], if_not_exists=True)
+    op.execute("ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS trip_id INTEGER REFERENCES trips (id)")
+    op.execute("ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS stop_sequence INTEGER")
+    op.create_index("ix_deliveries_trip_id", "deliveries", ["trip_id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_deliveries_trip_id", table_name="deliveries")
+    op.drop_column("deliveries", "stop_sequence")
+    op.drop_column("deliveries", "trip_id")
+    op.drop_index("ix_trips_id", table_name="trips")
+    op.drop_table("trips")
@@ -0,0 +1,42 @@
+"""hourly stats rollups
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stats_orders_hourly",
+        sa.Column("hour", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("category", sa.String(), primary_key=True),
+        sa.Column("order_count", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Numeric(14, 2), nullable=False),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "stats_deliveries_hourly",
+        sa.Column("hour", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("category", sa.String(), primary_key=True),
+        sa.Column("delivered_count", sa.Integer(), nullable=False),
+        sa.Column("total_duration_seconds", sa.Numeric(16, 2), nullable=False),
+        sa.Column("with_eta_count", sa.Integer(), nullable=False),
+        sa.Column("on_time_count", sa.Integer(), nullable=False),
+        if_not_exists=True,
+    )
+    # Агрегаты заполняются из истории: python -m app.stats backfill
+
+
+def downgrade() -> None:
+    op.drop_table("stats_deliveries_hourly")
+    op.drop_table("stats_orders_hourly")
@@ -0,0 +1,24 @@
+"""deliveries (status, created_at) index
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_deliveries_status_created", "deliveries", ["status", "created_at"], if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_deliveries_status_created", table_name="deliveries")
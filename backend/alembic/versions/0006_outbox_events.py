@@ -0,0 +1,47 @@
+"""transactional outbox
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbox_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("aggregate_type", sa.String(), nullable=False),
+        sa.Column("aggregate_id", sa.Integer(), nullable=False),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("published_at", sa.DateTime(timezone=True)),
+        if_not_exists=True,
+    )
+    op.create_index("ix_outbox_events_id", "outbox_events", ["id"], if_not_exists=True)
+    op.create_index("ix_outbox_events_aggregate_id", "outbox_events", ["aggregate_id"], if_not_exists=True)
+    op.create_index(
+        "ix_outbox_events_unpublished",
+        "outbox_events",
+        ["id"],
+        postgresql_where=sa.text("published_at IS NULL"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_outbox_events_unpublished", table_name="outbox_events")
+    op.drop_index("ix_outbox_events_aggregate_id", table_name="outbox_events")
+    op.drop_index("ix_outbox_events_id", table_name="outbox_events")
+    op.drop_table("outbox_events")
@@ -0,0 +1,25 @@
+"""deliveries.promised_arrival
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS promised_arrival TIMESTAMP WITH TIME ZONE")
+    # Для старых доставок первоначальная ETA не сохранилась, берём последнюю известную;
+    # после миграции агрегаты пересчитываются: python -m app.stats backfill
+    op.execute("UPDATE deliveries SET promised_arrival = estimated_arrival WHERE promised_arrival IS NULL")
+
+
+def downgrade() -> None:
+    op.drop_column("deliveries", "promised_arrival")
@@ -1,31 +1,58 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app import models, schemas
+from sqlalchemy import desc, func, lambda_stmt, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import models, schemas, eta, routing, stats
+from app.cache import TTLCache
+from app.partitions import sweep_lower_bound
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import os
 import random
 import string
 
 
+taken_emails = TTLCache(
+    ttl=float(os.getenv("TAKEN_EMAILS_CACHE_TTL", "3600")),
+    maxsize=int(os.getenv("TAKEN_EMAILS_CACHE_SIZE", "100000")),
+)
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.id == user_id).first()
 
 
 def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
-    return db.query(models.User).filter(models.User.email == email).first()
+    normalized = normalize_email(email)
+    stmt = lambda_stmt(lambda: select(models.User).where(func.lower(models.User.email) == normalized).limit(1))
+    return db.scalars(stmt).first()
+
+
+def is_email_known_taken(email: str) -> bool:
+    return taken_emails.get(normalize_email(email)) is not None
 
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
+def create_user(db: Session, user: schemas.UserCreate) -> Optional[models.User]:
     from app.auth import get_password_hash
     user_data = user.dict()
     password = user_data.pop("password")
-    db_user = models.User(
-        **user_data,
-        hashed_password=get_password_hash(password)
+    user_data["email"] = normalize_email(user_data["email"])
+    stmt = (
+        pg_insert(models.User)
+        .values(**user_data, hashed_password=get_password_hash(password), is_active=True)
+        .on_conflict_do_nothing(index_elements=[func.lower(models.User.email)])
+        .returning(models.User)
     )
-    db.add(db_user)
+    db_user = db.scalars(stmt).first()
+    if db_user is not None:
+        # Строка уже загружена RETURNING; commit иначе просрочит её и ответ потребует второй SELECT
+        db.expunge(db_user)
     db.commit()
-    db.refresh(db_user)
+    taken_emails.set(user_data["email"], True)
     return db_user
 
 
@@ -47,69 +74,141 @@ def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.User]
     return db.query(models.User).offset(skip).limit(limit).all()
 
 
+def _select_order(db: Session, order_id: int) -> Optional[models.Order]:
+    stmt = lambda_stmt(lambda: select(models.Order).where(models.Order.id == order_id).limit(1))
+    return db.scalars(stmt).first()
+
+
 def get_order(db: Session, order_id: int) -> Optional[models.Order]:
-    update_pending_orders_status(db)
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    order = _select_order(db, order_id)
     if order:
         _ = order.delivery
     return order
 
 
 def get_orders(db: Session, skip: int = 0, limit: int = 100) -> List[models.Order]:
-    update_pending_orders_status(db)
     orders = db.query(models.Order).order_by(desc(models.Order.created_at)).offset(skip).limit(limit).all()
     for order in orders:
         _ = order.delivery
     return orders
 
 
+def record_event(db: Session, aggregate_type: str, aggregate_id: int, event_type: str, payload: dict):
+    db.add(models.OutboxEvent(
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        event_type=event_type,
+        payload=payload,
+    ))
+
+
+def _event_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
 def generate_drone_id() -> str:
     return f"DRONE-{''.join(random.choices(string.ascii_uppercase + string.digits, k=6))}"
 
 
-def update_pending_orders_status(db: Session):
+def _select_due_orders(db: Session, status: str, since: datetime, until: datetime) -> List[models.Order]:
+    stmt = lambda_stmt(lambda: select(models.Order).where(
+        models.Order.status == status,
+        models.Order.created_at >= since,
+        models.Order.created_at <= until
+    ).with_for_update(skip_locked=True))
+    return db.scalars(stmt).all()
+
+
+def update_pending_orders_status(db: Session, lookback: Optional[datetime] = None):
     now = datetime.now(timezone.utc)
     one_minute_ago = now - timedelta(minutes=1)
     two_minutes_ago = now - timedelta(minutes=2)
-    pending_orders = db.query(models.Order).filter(
-        models.Order.status == "pending",
-        models.Order.created_at <= one_minute_ago
-    ).all()
+    lookback = lookback or sweep_lower_bound(now)
+    pending_orders = _select_due_orders(db, "pending", lookback, one_minute_ago)
     
-    for order in pending_orders:
-        order.status = "in_delivery"
+    queue_depth = count_active_orders(db, lookback) + len(pending_orders)
+    planned_trips = routing.plan_trips(pending_orders) if pending_orders else []
+    orders_by_id = {order.id: order for order in pending_orders}
+    
+    for planned in planned_trips:
+        trip = models.Trip(
+            drone_id=generate_drone_id(),
+            status="in_flight",
+            stop_count=len(planned.stops),
+            distance_km=round(planned.distance_km, 2),
+            payload_kg=round(planned.payload_kg, 2),
+        )
+        db.add(trip)
+        db.flush()
+        arrival_minutes = routing.trip_arrival_minutes(planned, queue_depth)
         
-        existing_delivery = get_delivery_by_order(db, order.id)
-        if not existing_delivery:
-            drone_id = generate_drone_id()
-            estimated_arrival = now + timedelta(minutes=1)
+        for stop_sequence, order_id in enumerate(planned.order_ids, start=1):
+            order = orders_by_id[order_id]
+            order.status = "in_delivery"
+            record_event(db, "order", order.id, "order.status_changed", {
+                "order_id": order.id,
+                "user_id": order.user_id,
+                "from": "pending",
+                "to": "in_delivery",
+                "at": now.isoformat(),
+            })
+            estimated_arrival = now + timedelta(minutes=arrival_minutes[order.id])
             
-            delivery = models.Delivery(
-                order_id=order.id,
-                drone_id=drone_id,
-                status="in_transit",
-                estimated_arrival=estimated_arrival
-            )
-            db.add(delivery)
-            print(f"🚁 Создана доставка для заказа #{order.id}, дрон: {drone_id}, статус: in_transit")
-        else:
-            existing_delivery.status = "in_transit"
-            if not existing_delivery.estimated_arrival:
-                existing_delivery.estimated_arrival = now + timedelta(minutes=1)
-            print(f"🚁 Обновлена доставка для заказа #{order.id}, статус: in_transit")
+            delivery = get_delivery_by_order(db, order.id, order.created_at)
+            if not delivery:
+                delivery = models.Delivery(
+                    order_id=order.id,
+                    status="in_transit",
+                    estimated_arrival=estimated_arrival
+                )
+                db.add(delivery)
+                print(f"🚁 Создана доставка для заказа #{order.id}, дрон: {trip.drone_id}, рейс #{trip.id}, остановка {stop_sequence}")
+            else:
+                delivery.status = "in_transit"
+                if not delivery.estimated_arrival:
+                    delivery.estimated_arrival = estimated_arrival
+                print(f"🚁 Обновлена доставка для заказа #{order.id}, рейс #{trip.id}, статус: in_transit")
+            _promise_arrival(delivery)
+            delivery.drone_id = trip.drone_id
+            delivery.trip_id = trip.id
+            delivery.stop_sequence = stop_sequence
+            record_event(db, "delivery", order.id, "delivery.dispatched", {
+                "order_id": order.id,
+                "drone_id": trip.drone_id,
+                "trip_id": trip.id,
+                "stop_sequence": stop_sequence,
+                "estimated_arrival": _event_value(delivery.estimated_arrival),
+            })
     
-    in_delivery_orders = db.query(models.Order).filter(
-        models.Order.status == "in_delivery",
-        models.Order.created_at <= two_minutes_ago
-    ).all()
+    in_delivery_orders = _select_due_orders(db, "in_delivery", lookback, two_minutes_ago)
     
+    completed_deliveries = []
     for order in in_delivery_orders:
         order.status = "delivered"
+        record_event(db, "order", order.id, "order.status_changed", {
+            "order_id": order.id,
+            "user_id": order.user_id,
+            "from": "in_delivery",
+            "to": "delivered",
+            "at": now.isoformat(),
+        })
         
-        delivery = get_delivery_by_order(db, order.id)
+        delivery = get_delivery_by_order(db, order.id, order.created_at)
         if delivery:
-            delivery.status = "delivered"
-            delivery.actual_arrival = now
+            # Доставку, закрытую вручную, агрегаты уже учли с её временем прибытия
+            if delivery.status != "delivered":
+                delivery.status = "delivered"
+                delivery.actual_arrival = now
+                completed_deliveries.append((order, delivery))
+            record_event(db, "delivery", order.id, "delivery.completed", {
+                "order_id": order.id,
+                "drone_id": delivery.drone_id,
+                "actual_arrival": _event_value(delivery.actual_arrival),
+            })
             print(f"✅ Доставка завершена для заказа #{order.id}, дрон: {delivery.drone_id}")
         else:
             drone_id = generate_drone_id()
@@ -117,18 +216,38 @@ def update_pending_orders_status(db: Session):
                 order_id=order.id,
                 drone_id=drone_id,
                 status="delivered",
-                actual_arrival=now
+                actual_arrival=now,
+                created_at=now
             )
             db.add(delivery)
+            record_event(db, "delivery", order.id, "delivery.completed", {
+                "order_id": order.id,
+                "drone_id": drone_id,
+                "actual_arrival": now.isoformat(),
+            })
+            completed_deliveries.append((order, delivery))
             print(f"✅ Создана запись о завершенной доставке для заказа #{order.id}, дрон: {drone_id}")
     
+    stats.record_deliveries_completed(db, completed_deliveries, now)
+    
+    completed_trip_ids = {
+        order.delivery.trip_id
+        for order in in_delivery_orders
+        if order.delivery and order.delivery.trip_id
+    }
+    if completed_trip_ids:
+        db.flush()
+        complete_finished_trips(db, completed_trip_ids, now)
+    
+    refreshed_count = refresh_delivery_etas(db, now)
+    
     updated_count = len(pending_orders) + len(in_delivery_orders)
-    if updated_count > 0:
+    if updated_count > 0 or refreshed_count > 0:
         try:
             db.commit()
             for order in pending_orders + in_delivery_orders:
                 db.refresh(order)
-                delivery = get_delivery_by_order(db, order.id)
+                delivery = get_delivery_by_order(db, order.id, order.created_at)
                 if delivery:
                     db.refresh(delivery)
             print(f"✅ Обновлено статусов заказов в БД: {updated_count}")
@@ -140,9 +259,93 @@ def update_pending_orders_status(db: Session):
     return updated_count
 
 
+def complete_finished_trips(db: Session, trip_ids, now: datetime):
+    trips = db.query(models.Trip).filter(
+        models.Trip.id.in_(trip_ids),
+        models.Trip.status != "completed"
+    ).all()
+    for trip in trips:
+        if all(delivery.status == "delivered" for delivery in trip.deliveries):
+            trip.status = "completed"
+            trip.completed_at = now
+            print(f"✅ Рейс #{trip.id} завершен, дрон: {trip.drone_id}, остановок: {trip.stop_count}")
+
+
+def count_active_orders(db: Session, since: datetime) -> int:
+    stmt = lambda_stmt(lambda: select(func.count(models.Order.id)).where(
+        models.Order.status == "in_delivery",
+        models.Order.created_at >= since
+    ))
+    return db.scalar(stmt) or 0
+
+
+def _promise_arrival(delivery: models.Delivery):
+    if delivery.promised_arrival is None and delivery.estimated_arrival is not None:
+        delivery.promised_arrival = delivery.estimated_arrival
+
+
+def refresh_delivery_etas(db: Session, now: datetime) -> int:
+    stale_deliveries = db.query(models.Delivery).filter(
+        models.Delivery.status == "in_transit",
+        models.Delivery.created_at >= sweep_lower_bound(now),
+        or_(
+            models.Delivery.estimated_arrival.is_(None),
+            models.Delivery.estimated_arrival < now
+        )
+    ).order_by(models.Delivery.id).limit(eta.REFRESH_BATCH_SIZE).all()
+    if not stale_deliveries:
+        return 0
+    
+    orders = [delivery.order for delivery in stale_deliveries if delivery.order]
+    estimates = eta.estimate_minutes_batch(orders, queue_depth=0)
+    for delivery in stale_deliveries:
+        if delivery.order_id not in estimates:
+            continue
+        _, minutes = estimates[delivery.order_id]
+        started_at = delivery.created_at or now
+        estimated_arrival = started_at + timedelta(minutes=minutes)
+        if estimated_arrival < now:
+            estimated_arrival = now + timedelta(minutes=eta.HANDLING_MINUTES)
+        delivery.estimated_arrival = estimated_arrival
+        _promise_arrival(delivery)
+    return len(stale_deliveries)
+
+
+def get_order_eta(db: Session, order_id: int) -> Optional[dict]:
+    order = get_order(db, order_id)
+    if not order:
+        return None
+    now = datetime.now(timezone.utc)
+    queue_depth = count_active_orders(db, sweep_lower_bound(now))
+    distance_km, minutes = eta.estimate_minutes_batch([order], queue_depth)[order.id]
+    delivery = order.delivery
+    
+    if delivery and delivery.actual_arrival:
+        estimated_arrival, source = delivery.actual_arrival, "actual"
+    elif delivery and delivery.estimated_arrival:
+        estimated_arrival, source = delivery.estimated_arrival, "delivery"
+    else:
+        dispatch_at = max(now, order.created_at + timedelta(minutes=1))
+        estimated_arrival, source = dispatch_at + timedelta(minutes=minutes), "estimate"
+    
+    return {
+        "order_id": order.id,
+        "status": order.status,
+        "distance_km": round(distance_km, 2),
+        "queue_depth": queue_depth,
+        "estimated_arrival": estimated_arrival,
+        "minutes_remaining": max(0.0, round((estimated_arrival - now).total_seconds() / 60, 1)),
+        "source": source,
+    }
+
+
+def _select_orders_by_user(db: Session, user_id: int, skip: int, limit: int) -> List[models.Order]:
+    stmt = lambda_stmt(lambda: select(models.Order).where(models.Order.user_id == user_id).order_by(desc(models.Order.created_at)).offset(skip).limit(limit))
+    return db.scalars(stmt).all()
+
+
 def get_orders_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Order]:
-    update_pending_orders_status(db)
-    orders = db.query(models.Order).filter(models.Order.user_id == user_id).order_by(desc(models.Order.created_at)).offset(skip).limit(limit).all()
+    orders = _select_orders_by_user(db, user_id, skip, limit)
     for order in orders:
         _ = order.delivery
     return orders
@@ -166,6 +369,14 @@ def create_order(db: Session, order: schemas.OrderCreate) -> models.Order:
         status="pending"
     )
     db.add(db_order)
+    db.flush()
+    stats.record_order_created(db, db_order)
+    record_event(db, "order", db_order.id, "order.created", {
+        "order_id": db_order.id,
+        "user_id": db_order.user_id,
+        "category": db_order.category,
+        "price": str(db_order.price),
+    })
     db.commit()
     db.refresh(db_order)
     return db_order
@@ -175,8 +386,18 @@ def update_order(db: Session, order_id: int, order_update: schemas.OrderUpdate)
     db_order = get_order(db, order_id)
     if db_order:
         update_data = order_update.dict(exclude_unset=True)
+        previous_status = db_order.status
         for key, value in update_data.items():
             setattr(db_order, key, value)
+        if update_data:
+            event_type = "order.status_changed" if db_order.status != previous_status else "order.updated"
+            record_event(db, "order", db_order.id, event_type, {
+                "order_id": db_order.id,
+                "user_id": db_order.user_id,
+                "from": previous_status,
+                "to": db_order.status,
+                "changes": {key: _event_value(value) for key, value in update_data.items()},
+            })
         db.commit()
         db.refresh(db_order)
     return db_order
@@ -185,6 +406,7 @@ def update_order(db: Session, order_id: int, order_update: schemas.OrderUpdate)
 def delete_order(db: Session, order_id: int) -> bool:
     db_order = get_order(db, order_id)
     if db_order:
+        stats.record_order_deleted(db, db_order)
         db.delete(db_order)
         db.commit()
         return True
@@ -195,12 +417,33 @@ def get_delivery(db: Session, delivery_id: int) -> Optional[models.Delivery]:
     return db.query(models.Delivery).filter(models.Delivery.id == delivery_id).first()
 
 
-def get_delivery_by_order(db: Session, order_id: int) -> Optional[models.Delivery]:
-    return db.query(models.Delivery).filter(models.Delivery.order_id == order_id).first()
+def get_delivery_by_order(db: Session, order_id: int, since: Optional[datetime] = None) -> Optional[models.Delivery]:
+    # Доставка создаётся не раньше заказа: граница по created_at отсекает старые партиции
+    if since is None:
+        order = _select_order(db, order_id)
+        if not order:
+            return None
+        since = order.created_at
+    stmt = lambda_stmt(lambda: select(models.Delivery).where(
+        models.Delivery.order_id == order_id,
+        models.Delivery.created_at >= since
+    ).limit(1))
+    return db.scalars(stmt).first()
+
+
+def _lock_order(db: Session, order_id: int) -> Optional[models.Order]:
+    stmt = lambda_stmt(lambda: select(models.Order).where(models.Order.id == order_id).with_for_update())
+    return db.scalars(stmt).first()
 
 
-def create_delivery(db: Session, delivery: schemas.DeliveryCreate) -> models.Delivery:
+def create_delivery(db: Session, delivery: schemas.DeliveryCreate) -> Optional[models.Delivery]:
+    # Блокировка заказа сериализует проверку и вставку между параллельными запросами
+    order = _lock_order(db, delivery.order_id)
+    if not order or get_delivery_by_order(db, order.id, order.created_at):
+        db.rollback()
+        return None
     db_delivery = models.Delivery(**delivery.dict())
+    _promise_arrival(db_delivery)
     db.add(db_delivery)
     db.commit()
     db.refresh(db_delivery)
@@ -211,8 +454,24 @@ def update_delivery(db: Session, delivery_id: int, delivery_update: schemas.Deli
     db_delivery = get_delivery(db, delivery_id)
     if db_delivery:
         update_data = delivery_update.dict(exclude_unset=True)
+        previous_status = db_delivery.status
         for key, value in update_data.items():
             setattr(db_delivery, key, value)
+        _promise_arrival(db_delivery)
+        if db_delivery.status == "delivered" and previous_status != "delivered" and db_delivery.order:
+            now = datetime.now(timezone.utc)
+            if not db_delivery.actual_arrival:
+                db_delivery.actual_arrival = now
+            stats.record_deliveries_completed(db, [(db_delivery.order, db_delivery)], now)
+        if update_data:
+            event_type = "delivery.status_changed" if db_delivery.status != previous_status else "delivery.updated"
+            record_event(db, "delivery", db_delivery.order_id, event_type, {
+                "order_id": db_delivery.order_id,
+                "delivery_id": db_delivery.id,
+                "from": previous_status,
+                "to": db_delivery.status,
+                "changes": {key: _event_value(value) for key, value in update_data.items()},
+            })
         db.commit()
         db.refresh(db_delivery)
     return db_delivery
@@ -222,3 +481,9 @@ def get_deliveries(db: Session, skip: int = 0, limit: int = 100) -> List[models.
     return db.query(models.Delivery).order_by(desc(models.Delivery.created_at)).offset(skip).limit(limit).all()
 
 
+def get_trip(db: Session, trip_id: int) -> Optional[models.Trip]:
+    return db.query(models.Trip).filter(models.Trip.id == trip_id).first()
+
+
+def get_trips(db: Session, skip: int = 0, limit: int = 100) -> List[models.Trip]:
+    return db.query(models.Trip).order_by(desc(models.Trip.created_at)).offset(skip).limit(limit).all()
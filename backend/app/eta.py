@@ -0,0 +1,101 @@
+import hashlib
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.cache import TTLCache
+
+
+DRONE_SPEED_KMH = float(os.getenv("DRONE_SPEED_KMH", "60"))
+DRONE_MAX_PAYLOAD_KG = float(os.getenv("DRONE_MAX_PAYLOAD_KG", "5"))
+PAYLOAD_SLOWDOWN = float(os.getenv("DRONE_PAYLOAD_SLOWDOWN", "0.3"))
+FLEET_SIZE = int(os.getenv("DRONE_FLEET_SIZE", "20"))
+HANDLING_MINUTES = float(os.getenv("ETA_HANDLING_MINUTES", "2"))
+CITY_RADIUS_KM = float(os.getenv("ETA_CITY_RADIUS_KM", "15"))
+CELL_SIZE_KM = float(os.getenv("ETA_CELL_SIZE_KM", "0.5"))
+ROUTE_CACHE_TTL = float(os.getenv("ETA_CACHE_TTL_SECONDS", "600"))
+ROUTE_CACHE_SIZE = int(os.getenv("ETA_CACHE_SIZE", "50000"))
+REFRESH_BATCH_SIZE = int(os.getenv("ETA_REFRESH_BATCH", "200"))
+
+HUB_POINT = (0.0, 0.0)
+
+Point = Tuple[float, float]
+Cell = Tuple[int, int]
+
+
+route_cache = TTLCache(ROUTE_CACHE_TTL, ROUTE_CACHE_SIZE)
+
+
+# Адреса хранятся строкой без координат, поэтому точка на карте выводится
+# детерминированно из адреса внутри радиуса города вокруг хаба.
+def address_to_point(address: str) -> Point:
+    digest = hashlib.sha256((address or "").strip().lower().encode("utf-8")).digest()
+    u = int.from_bytes(digest[:8], "big") / 2 ** 64
+    v = int.from_bytes(digest[8:16], "big") / 2 ** 64
+    radius = CITY_RADIUS_KM * math.sqrt(u)
+    angle = 2 * math.pi * v
+    return HUB_POINT[0] + radius * math.cos(angle), HUB_POINT[1] + radius * math.sin(angle)
+
+
+def point_to_cell(point: Point) -> Cell:
+    return math.floor(point[0] / CELL_SIZE_KM), math.floor(point[1] / CELL_SIZE_KM)
+
+
+def cell_center(cell: Cell) -> Point:
+    return (cell[0] + 0.5) * CELL_SIZE_KM, (cell[1] + 0.5) * CELL_SIZE_KM
+
+
+def route_distances(pairs: Iterable[Tuple[Cell, Cell]]) -> Dict[Tuple[Cell, Cell], float]:
+    result: Dict[Tuple[Cell, Cell], float] = {}
+    missing: List[Tuple[Cell, Cell]] = []
+    for pair in set(pairs):
+        cached = route_cache.get(pair)
+        if cached is None:
+            missing.append(pair)
+        else:
+            result[pair] = cached
+    if missing:
+        origins = [cell_center(origin) for origin, _ in missing]
+        destinations = [cell_center(destination) for _, destination in missing]
+        distances = [
+            math.hypot(ox - dx, oy - dy)
+            for (ox, oy), (dx, dy) in zip(origins, destinations)
+        ]
+        for pair, distance in zip(missing, distances):
+            route_cache.set(pair, distance)
+            result[pair] = distance
+    return result
+
+
+def payload_speed(weight: Optional[float]) -> float:
+    load = min(max(float(weight or 0), 0.0), DRONE_MAX_PAYLOAD_KG) / DRONE_MAX_PAYLOAD_KG
+    return DRONE_SPEED_KMH * (1 - PAYLOAD_SLOWDOWN * load)
+
+
+def flight_minutes(distance_km: float, weight: Optional[float]) -> float:
+    return distance_km / payload_speed(weight) * 60 + HANDLING_MINUTES
+
+
+def queue_wait_minutes(queue_depth: int) -> float:
+    if queue_depth <= FLEET_SIZE:
+        return 0.0
+    average_trip = flight_minutes(CITY_RADIUS_KM * 2 / 3, None) * 2
+    return (queue_depth - FLEET_SIZE) / FLEET_SIZE * average_trip
+
+
+def order_route(order) -> Tuple[Cell, Cell]:
+    return point_to_cell(HUB_POINT), point_to_cell(address_to_point(order.delivery_address))
+
+
+def estimate_minutes_batch(orders: List, queue_depth: int) -> Dict[int, Tuple[float, float]]:
+    routes = {order.id: order_route(order) for order in orders}
+    distances = route_distances(routes.values())
+    wait = queue_wait_minutes(queue_depth)
+    return {
+        order.id: (
+            distances[routes[order.id]],
+            wait + flight_minutes(distances[routes[order.id]], order.weight),
+        )
+        for order in orders
+    }
+
@@ -0,0 +1,234 @@
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+FRONTEND_SRC = os.getenv("FRONTEND_SRC", PROJECT_ROOT)
+FRONTEND_DIST = os.getenv("FRONTEND_DIST", os.path.join(PROJECT_ROOT, "frontend_dist"))
+SERVE_FRONTEND = os.getenv("SERVE_FRONTEND", "false").lower() in ("1", "true", "yes")
+FRONTEND_PREFIX = os.getenv("FRONTEND_PREFIX", "/app")
+
+GOOGLE_FONTS_URL = "https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap"
+# Google Fonts отдаёт woff2 только современным браузерам
+FONTS_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+GOOGLE_FONTS_LINKS_RE = re.compile(
+    r'\s*<link rel="preconnect" href="https://fonts\.googleapis\.com">'
+    r'\s*<link rel="preconnect" href="https://fonts\.gstatic\.com" crossorigin>'
+    r'\s*<link href="https://fonts\.googleapis\.com/css2\?[^"]*" rel="stylesheet">'
+)
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{12}\.\w+$")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_SIZE = 512
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+
+def _download(url: str) -> bytes:
+    request = urllib.request.Request(url, headers={"User-Agent": FONTS_USER_AGENT})
+    with urllib.request.urlopen(request, timeout=15) as response:
+        return response.read()
+
+
+def build_fonts(out_dir: str) -> Optional[str]:
+    try:
+        css = _download(GOOGLE_FONTS_URL).decode("utf-8")
+        fonts_dir = os.path.join(out_dir, "fonts")
+        os.makedirs(fonts_dir, exist_ok=True)
+
+        def replace_url(match):
+            data = _download(match.group(1))
+            name = hashed_name("inter.woff2", data)
+            with open(os.path.join(fonts_dir, name), "wb") as f:
+                f.write(data)
+            return f"url({name})"
+
+        css = re.sub(r"url\((https://fonts\.gstatic\.com/[^)]+)\)", replace_url, css)
+        data = css.encode("utf-8")
+        name = hashed_name("inter.css", data)
+        with open(os.path.join(fonts_dir, name), "wb") as f:
+            f.write(data)
+        return f"fonts/{name}"
+    except Exception as e:
+        print(f"⚠️  Не удалось загрузить шрифты, остаются ссылки на Google Fonts: {e}")
+        return None
+
+
+def compress_file(path: str):
+    with open(path, "rb") as f:
+        data = f.read()
+    content_type = mimetypes.guess_type(path)[0] or ""
+    if len(data) < MIN_COMPRESS_SIZE or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build_frontend(src_dir: str = FRONTEND_SRC, out_dir: str = FRONTEND_DIST) -> str:
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    with open(os.path.join(src_dir, "style.css"), "rb") as f:
+        css = f.read()
+    css_name = hashed_name("style.css", css)
+    with open(os.path.join(out_dir, css_name), "wb") as f:
+        f.write(css)
+
+    fonts_css = build_fonts(out_dir)
+
+    for name in sorted(os.listdir(src_dir)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(src_dir, name), "r", encoding="utf-8") as f:
+            html = f.read()
+        html = html.replace('href="style.css"', f'href="{css_name}"')
+        if fonts_css:
+            html = GOOGLE_FONTS_LINKS_RE.sub(f'\n    <link rel="stylesheet" href="{fonts_css}">', html)
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            f.write(html)
+
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            compress_file(os.path.join(root, name))
+
+    print(f"✅ Фронтенд собран в {out_dir}")
+    return out_dir
+
+
+@dataclass
+class StaticAsset:
+    body: bytes
+    content_type: str
+    etag: str
+    cache_control: str
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+def load_assets(dist_dir: str) -> Dict[str, StaticAsset]:
+    assets: Dict[str, StaticAsset] = {}
+    for root, _, files in os.walk(dist_dir):
+        for name in files:
+            if name.endswith((".gz", ".br")):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                body = f.read()
+            encoded = {}
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if os.path.exists(path + suffix):
+                    with open(path + suffix, "rb") as f:
+                        encoded[encoding] = f.read()
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type.startswith("text/"):
+                content_type += "; charset=utf-8"
+            is_hashed = bool(HASHED_NAME_RE.search(name))
+            assets[os.path.relpath(path, dist_dir).replace(os.sep, "/")] = StaticAsset(
+                body=body,
+                content_type=content_type,
+                etag=f'"{content_hash(body)}"',
+                cache_control=IMMUTABLE_CACHE_CONTROL if is_hashed else REVALIDATE_CACHE_CONTROL,
+                encoded=encoded,
+            )
+    return assets
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    # If-None-Match сравнивается слабо: префикс W/ не учитывается
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class FrontendApp:
+    def __init__(self, dist_dir: str = FRONTEND_DIST, index: str = "index.html"):
+        self.assets = load_assets(dist_dir)
+        self.index = index
+
+    def build_response(self, path: str, headers: Dict[str, str], method: str) -> Response:
+        path = path.lstrip("/") or self.index
+        asset = self.assets.get(path)
+        if asset is None:
+            return Response("Not Found", status_code=404, media_type="text/plain")
+
+        response_headers = {
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        body, etag = asset.body, asset.etag
+        accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in asset.encoded:
+                body = asset.encoded[encoding]
+                # Сильный валидатор различается для каждого content-coding
+                etag = f'{asset.etag[:-1]}-{encoding}"'
+                response_headers["Content-Encoding"] = encoding
+                break
+        response_headers["ETag"] = etag
+        if _etag_matches(headers.get("if-none-match"), etag):
+            response_headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=response_headers)
+        if method == "HEAD":
+            response_headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, headers=response_headers, media_type=asset.content_type)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        response = self.build_response(path, headers, scope["method"])
+        await response(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка статического фронтенда")
+    parser.add_argument("--src", default=FRONTEND_SRC)
+    parser.add_argument("--out", default=FRONTEND_DIST)
+    args = parser.parse_args()
+    build_frontend(args.src, args.out)
+
+
+if __name__ == "__main__":
+    main()
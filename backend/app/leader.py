@@ -0,0 +1,115 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+
+# Ключ advisory-блокировки Postgres, которой владеет ровно один процесс
+BACKGROUND_LOCK_KEY = int(os.getenv("BACKGROUND_LOCK_KEY", "724301"))
+LEADER_RETRY_SECONDS = float(os.getenv("LEADER_RETRY_SECONDS", "5"))
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("BACKGROUND_DRAIN_TIMEOUT", "30"))
+
+JobFactory = Callable[[asyncio.Event], Awaitable[None]]
+
+
+async def sleep_or_stop(stopping: asyncio.Event, seconds: float) -> bool:
+    try:
+        await asyncio.wait_for(stopping.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+class BackgroundLeader:
+    def __init__(self, engine: Engine, jobs: List[JobFactory], lock_key: int = BACKGROUND_LOCK_KEY):
+        self.engine = engine
+        self.jobs = jobs
+        self.lock_key = lock_key
+        self.is_leader = False
+        self._connection: Optional[Connection] = None
+        self._job_tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._campaign: Optional[asyncio.Task] = None
+
+    def _try_acquire(self) -> bool:
+        connection = self.engine.connect()
+        try:
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}
+            ).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if acquired:
+            self._connection = connection
+        else:
+            connection.close()
+        return bool(acquired)
+
+    def _still_holding(self) -> bool:
+        try:
+            self._connection.execute(text("SELECT 1"))
+            self._connection.commit()
+            return True
+        except Exception:
+            return False
+
+    def _release(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            self._connection.commit()
+        except Exception as e:
+            print(f"⚠️  Не удалось освободить блокировку фоновых задач: {e}")
+        finally:
+            self._connection.close()
+            self._connection = None
+
+    def _start_jobs(self):
+        self._stopping = asyncio.Event()
+        self._job_tasks = [asyncio.create_task(job(self._stopping)) for job in self.jobs]
+
+    async def _stop_jobs(self):
+        if not self._job_tasks:
+            return
+        # Задачи завершают текущую итерацию сами; по таймауту отменяются
+        self._stopping.set()
+        _, pending = await asyncio.wait(self._job_tasks, timeout=DRAIN_TIMEOUT_SECONDS)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._job_tasks, return_exceptions=True)
+        self._job_tasks = []
+
+    async def _run(self):
+        while True:
+            try:
+                if not self.is_leader:
+                    if await asyncio.to_thread(self._try_acquire):
+                        self.is_leader = True
+                        self._start_jobs()
+                        print(f"✅ Процесс {os.getpid()} выполняет фоновые задачи")
+                elif not await asyncio.to_thread(self._still_holding):
+                    print(f"⚠️  Процесс {os.getpid()} потерял блокировку фоновых задач")
+                    self.is_leader = False
+                    await self._stop_jobs()
+                    await asyncio.to_thread(self._release)
+            except Exception as e:
+                print(f"❌ Ошибка при захвате блокировки фоновых задач: {e}")
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+
+    def start(self):
+        self._campaign = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._campaign is not None:
+            self._campaign.cancel()
+            await asyncio.gather(self._campaign, return_exceptions=True)
+            self._campaign = None
+        await self._stop_jobs()
+        if self.is_leader:
+            await asyncio.to_thread(self._release)
+            self.is_leader = False
@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import timedelta
+from typing import List, Optional
+from datetime import datetime, timedelta
 import asyncio
+import os
+from contextlib import asynccontextmanager
 from app.database import get_db, engine, Base, SessionLocal
-from app import models, schemas, crud
+from app import models, schemas, crud, outbox, stats
+from app.partitions import ensure_partitions_for_engine, FULL_SWEEP_LOWER_BOUND, STRAGGLER_SWEEP_INTERVAL
+from app.leader import BackgroundLeader, sleep_or_stop
+from app.frontend import FrontendApp, SERVE_FRONTEND, FRONTEND_DIST, FRONTEND_PREFIX, build_frontend
+from app.ratelimit import RateLimitMiddleware, RATE_LIMIT_ENABLED, create_admission_controller, create_bucket_store
 from app.auth import (
     authenticate_user, 
     create_access_token, 
@@ -17,16 +24,47 @@ from app.auth import (
 try:
     Base.metadata.create_all(bind=engine)
     print("✅ Таблицы базы данных проверены/созданы")
+    created_partitions = ensure_partitions_for_engine(engine)
+    if created_partitions:
+        print(f"✅ Созданы партиции: {', '.join(created_partitions)}")
 except Exception as e:
     print(f"⚠️  Предупреждение: не удалось создать таблицы: {e}")
     print("⚠️  Убедитесь, что база данных создана и PostgreSQL запущен")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    leader = BackgroundLeader(engine, [
+        update_orders_status_background,
+        relay_outbox_background,
+        maintain_partitions_background,
+    ])
+    leader.start()
+    print("✅ Ожидание блокировки фоновых задач (статусы заказов, outbox, партиции)")
+    try:
+        yield
+    finally:
+        await leader.stop()
+        engine.dispose()
+        print("🛑 Фоновые задачи остановлены")
+
+
 app = FastAPI(
     title="DroneDelivery API",
     description="API для сервиса доставки дронами",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        secret_key=settings.secret_key,
+        algorithm=settings.algorithm,
+        store=create_bucket_store(),
+        admission=create_admission_controller(),
+        exempt_prefixes=(FRONTEND_PREFIX,) if SERVE_FRONTEND else (),
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -35,27 +73,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if SERVE_FRONTEND:
+    if not os.path.isdir(FRONTEND_DIST):
+        build_frontend()
+    # Mount не принимает префикс без слэша: относительные ссылки index.html
+    # разрешались бы от корня сайта, поэтому постоянно перенаправляем на префикс со слэшем
+    @app.get(FRONTEND_PREFIX, include_in_schema=False)
+    def frontend_redirect(request: Request):
+        query = request.url.query
+        return RedirectResponse(FRONTEND_PREFIX + "/" + (f"?{query}" if query else ""), status_code=308)
+
+    app.mount(FRONTEND_PREFIX, FrontendApp(FRONTEND_DIST), name="frontend")
+    print(f"✅ Фронтенд раздаётся по адресу {FRONTEND_PREFIX}/")
+
+
+# Сессия открывается и закрывается в том же потоке, что и работает с ней:
+# отмена задачи при остановке не должна закрывать сессию из event loop
+def _run_status_sweep(lookback: Optional[datetime]) -> int:
+    with SessionLocal() as db:
+        return crud.update_pending_orders_status(db, lookback)
+
+
+def _run_outbox_relay(sinks: List[outbox.EventSink]) -> int:
+    with SessionLocal() as db:
+        return outbox.relay_pending(db, sinks)
 
-async def update_orders_status_background():
-    while True:
+
+# Отправка и планирование рейсов идут только здесь, в процессе-лидере:
+# запросы на чтение статусы не двигают
+async def update_orders_status_background(stopping: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    last_full_sweep = loop.time()
+    while not stopping.is_set():
         try:
-            db = SessionLocal()
-            try:
-                updated = crud.update_pending_orders_status(db)
-                if updated > 0:
-                    print(f"🔄 Фоновая задача: обновлено {updated} заказов в БД")
-            finally:
-                db.close()
+            # Окно SWEEP_LOOKBACK_DAYS держит частый проход на свежих партициях,
+            # а редкий полный проход доводит застрявшие старые заказы
+            lookback = None
+            if loop.time() - last_full_sweep >= STRAGGLER_SWEEP_INTERVAL:
+                lookback, last_full_sweep = FULL_SWEEP_LOWER_BOUND, loop.time()
+            updated = await asyncio.to_thread(_run_status_sweep, lookback)
+            if updated > 0:
+                print(f"🔄 Фоновая задача: обновлено {updated} заказов в БД")
         except Exception as e:
             print(f"❌ Ошибка в фоновой задаче обновления статусов: {e}")
         
-        await asyncio.sleep(10)
+        await sleep_or_stop(stopping, 10)
 
 
-@app.on_event("startup")
-async def startup_event():
-    asyncio.create_task(update_orders_status_background())
-    print("✅ Фоновая задача обновления статусов заказов запущена")
+async def relay_outbox_background(stopping: asyncio.Event):
+    sinks = outbox.create_sinks_from_env()
+    interval = float(os.getenv("OUTBOX_RELAY_INTERVAL", "1.0"))
+    while not stopping.is_set():
+        try:
+            published = await asyncio.to_thread(_run_outbox_relay, sinks)
+            if published > 0:
+                print(f"📤 Outbox: опубликовано событий: {published}")
+        except Exception as e:
+            print(f"❌ Ошибка в фоновой задаче публикации событий: {e}")
+        
+        await sleep_or_stop(stopping, interval)
+
+
+async def maintain_partitions_background(stopping: asyncio.Event):
+    while not await sleep_or_stop(stopping, 6 * 60 * 60):
+        try:
+            created = await asyncio.to_thread(ensure_partitions_for_engine, engine)
+            if created:
+                print(f"✅ Фоновая задача: созданы партиции {', '.join(created)}")
+        except Exception as e:
+            print(f"❌ Ошибка в фоновой задаче обслуживания партиций: {e}")
 
 
 @app.get("/")
@@ -68,6 +154,11 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/outbox/stats")
+def read_outbox_stats(db: Session = Depends(get_db)):
+    return outbox.get_outbox_stats(db)
+
+
 @app.post("/auth/register", response_model=schemas.UserResponse, status_code=201)
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     try:
@@ -76,10 +167,11 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         
         if len(user.password) < 6:
             raise HTTPException(status_code=400, detail="Пароль должен содержать минимум 6 символов")
-        db_user = crud.get_user_by_email(db, email=user.email)
-        if db_user:
+        if crud.is_email_known_taken(user.email):
             raise HTTPException(status_code=400, detail="Email already registered")
         new_user = crud.create_user(db=db, user=user)
+        if new_user is None:
+            raise HTTPException(status_code=400, detail="Email already registered")
         return new_user
     except HTTPException:
         raise
@@ -183,6 +275,14 @@ def read_order(order_id: int, db: Session = Depends(get_db)):
     return db_order
 
 
+@app.get("/orders/{order_id}/eta", response_model=schemas.EtaResponse)
+def read_order_eta(order_id: int, db: Session = Depends(get_db)):
+    order_eta = crud.get_order_eta(db, order_id=order_id)
+    if order_eta is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order_eta
+
+
 @app.patch("/orders/{order_id}", response_model=schemas.OrderResponse)
 def update_order(order_id: int, order_update: schemas.OrderUpdate, db: Session = Depends(get_db)):
     db_order = crud.update_order(db, order_id=order_id, order_update=order_update)
@@ -204,11 +304,10 @@ def create_delivery(delivery: schemas.DeliveryCreate, db: Session = Depends(get_
     order = crud.get_order(db, order_id=delivery.order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    existing_delivery = crud.get_delivery_by_order(db, order_id=delivery.order_id)
-    if existing_delivery:
+    db_delivery = crud.create_delivery(db=db, delivery=delivery)
+    if db_delivery is None:
         raise HTTPException(status_code=400, detail="Delivery already exists for this order")
-    
-    return crud.create_delivery(db=db, delivery=delivery)
+    return db_delivery
 
 
 @app.get("/deliveries/", response_model=List[schemas.DeliveryResponse])
@@ -241,3 +340,34 @@ def update_delivery(delivery_id: int, delivery_update: schemas.DeliveryUpdate, d
     return db_delivery
 
 
+@app.get("/trips/", response_model=List[schemas.TripResponse])
+def read_trips(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return crud.get_trips(db, skip=skip, limit=limit)
+
+
+@app.get("/trips/{trip_id}", response_model=schemas.TripResponse)
+def read_trip(trip_id: int, db: Session = Depends(get_db)):
+    db_trip = crud.get_trip(db, trip_id=trip_id)
+    if db_trip is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return db_trip
+
+
+@app.get("/stats/orders", response_model=List[schemas.OrderStatsRow])
+def read_order_stats(since: Optional[datetime] = None, until: Optional[datetime] = None, db: Session = Depends(get_db)):
+    return stats.get_orders_hourly(db, since=since, until=until)
+
+
+@app.get("/stats/deliveries", response_model=List[schemas.DeliveryStatsRow])
+def read_delivery_stats(since: Optional[datetime] = None, until: Optional[datetime] = None, db: Session = Depends(get_db)):
+    return stats.get_deliveries_hourly(db, since=since, until=until)
+
+
+@app.get("/stats/revenue", response_model=List[schemas.RevenueByCategory])
+def read_revenue_stats(since: Optional[datetime] = None, until: Optional[datetime] = None, db: Session = Depends(get_db)):
+    return stats.get_revenue_by_category(db, since=since, until=until)
+
+
+@app.get("/stats/summary", response_model=schemas.DeliverySummary)
+def read_stats_summary(since: Optional[datetime] = None, until: Optional[datetime] = None, db: Session = Depends(get_db)):
+    return stats.get_on_time_summary(db, since=since, until=until)
@@ -1,9 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Numeric, ForeignKey, JSON, Index, PrimaryKeyConstraint
 from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
 from sqlalchemy.sql import func
 from app.database import Base
 
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class User(Base):
     __tablename__ = "users"
     
@@ -19,12 +24,16 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     orders = relationship("Order", back_populates="user")
+    
+    __table_args__ = (
+        Index("uq_users_email_lower", func.lower(email), unique=True),
+    )
 
 
 class Order(Base):
     __tablename__ = "orders"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, autoincrement=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     category = Column(String, nullable=False)
     status = Column(String, default="pending")
@@ -34,23 +43,115 @@ class Order(Base):
     delivery_time = Column(String)
     comment = Column(Text)
     price = Column(Numeric(10, 2), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     user = relationship("User", back_populates="orders")
-    delivery = relationship("Delivery", back_populates="order", uselist=False)
+    delivery = relationship(
+        "Delivery",
+        primaryjoin="and_(Order.id == foreign(Delivery.order_id), Delivery.created_at >= Order.created_at)",
+        back_populates="order",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+    
+    # Партиционирование по created_at: первичный ключ обязан включать ключ партиции.
+    # ORM тоже ключует строки по (id, created_at), чтобы UPDATE/DELETE при flush
+    # попадали в одну партицию; поиск по одному id отсечь партиции не может.
+    # created_at проставляется приложением, чтобы доставка (created_at не раньше
+    # заказа) находилась в связи с условием по ключу партиции.
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "created_at"),
+        Index("ix_orders_user_created", "user_id", "created_at"),
+        Index("ix_orders_status_created", "status", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id, created_at]}
 
 
 class Delivery(Base):
     __tablename__ = "deliveries"
     
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, unique=True)
+    id = Column(Integer, autoincrement=True, index=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    trip_id = Column(Integer, ForeignKey("trips.id"), index=True)
+    stop_sequence = Column(Integer)
     drone_id = Column(String)
     status = Column(String, default="assigned")
     estimated_arrival = Column(DateTime(timezone=True))
+    # Первая выданная ETA; estimated_arrival потом пересчитывается, а это обещание — нет
+    promised_arrival = Column(DateTime(timezone=True))
     actual_arrival = Column(DateTime(timezone=True))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
-    order = relationship("Order", back_populates="delivery")
+    order = relationship(
+        "Order",
+        primaryjoin="and_(foreign(Delivery.order_id) == Order.id, Order.created_at <= Delivery.created_at)",
+        back_populates="delivery",
+    )
+    trip = relationship("Trip", back_populates="deliveries")
+    
+    # Внешний ключ на партиционированную таблицу orders невозможен без created_at,
+    # поэтому связь order_id -> orders.id поддерживается приложением.
+    # По той же причине невозможен UNIQUE(order_id): одна доставка на заказ
+    # гарантируется блокировкой строки заказа в crud.create_delivery.
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "created_at"),
+        Index("ix_deliveries_status_created", "status", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id, created_at]}
+
+
+class Trip(Base):
+    __tablename__ = "trips"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    drone_id = Column(String, nullable=False)
+    status = Column(String, default="in_flight")
+    stop_count = Column(Integer, nullable=False)
+    distance_km = Column(Numeric(8, 2))
+    payload_kg = Column(Numeric(6, 2))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True))
+    
+    deliveries = relationship("Delivery", back_populates="trip", order_by="Delivery.stop_sequence")
+
+
+class OrderStatsHourly(Base):
+    __tablename__ = "stats_orders_hourly"
+    
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    category = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+
+
+class DeliveryStatsHourly(Base):
+    __tablename__ = "stats_deliveries_hourly"
+    
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    category = Column(String, primary_key=True)
+    delivered_count = Column(Integer, nullable=False, default=0)
+    total_duration_seconds = Column(Numeric(16, 2), nullable=False, default=0)
+    with_eta_count = Column(Integer, nullable=False, default=0)
+    on_time_count = Column(Integer, nullable=False, default=0)
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    aggregate_type = Column(String, nullable=False)
+    aggregate_id = Column(Integer, nullable=False, index=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    published_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        Index("ix_outbox_events_unpublished", "id", postgresql_where=published_at.is_(None)),
+    )
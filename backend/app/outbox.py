@@ -0,0 +1,204 @@
+import json
+import os
+import queue
+import threading
+import urllib.request
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+class EventSink(ABC):
+    name = "sink"
+
+    @abstractmethod
+    def publish(self, events: List[dict]):
+        ...
+
+
+class FileSink(EventSink):
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def publish(self, events: List[dict]):
+        lines = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class LocalQueueSink(EventSink):
+    # In-process очередь для встраивания и локальной разработки. Relay работает
+    # только в процессе-лидере, поэтому читать очередь через get() должен код,
+    # запущенный в этом же процессе. При переполнении батч не публикуется и
+    # повторяется позже (at-least-once): уже положенные события придут повторно.
+    name = "queue"
+
+    def __init__(self, maxsize: int = 10_000):
+        self.queue: "queue.Queue[dict]" = queue.Queue(maxsize=maxsize)
+
+    def publish(self, events: List[dict]):
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                raise RuntimeError("очередь событий outbox переполнена, батч будет повторён") from None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class HttpSink(EventSink):
+    name = "http"
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def publish(self, events: List[dict]):
+        body = json.dumps({"events": events}, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"HTTP sink вернул статус {response.status}")
+
+
+class RelayMetrics:
+    def __init__(self):
+        self.published = 0
+        self.failed_batches = 0
+        self.last_batch_size = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "published": self.published,
+            "failed_batches": self.failed_batches,
+            "last_batch_size": self.last_batch_size,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_error": self.last_error,
+        }
+
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_LAG_SECONDS = float(os.getenv("OUTBOX_MAX_LAG_SECONDS", "60"))
+
+metrics = RelayMetrics()
+# Единственная in-process очередь приёмника "queue", см. LocalQueueSink
+local_queue = LocalQueueSink(int(os.getenv("OUTBOX_QUEUE_SIZE", "10000")))
+
+
+def create_sinks_from_env() -> List[EventSink]:
+    sinks: List[EventSink] = []
+    for name in os.getenv("OUTBOX_SINKS", "file").split(","):
+        name = name.strip()
+        if name == "file":
+            default_path = os.path.join(os.path.dirname(__file__), "..", "outbox_events.jsonl")
+            sinks.append(FileSink(os.getenv("OUTBOX_FILE", default_path)))
+        elif name == "queue":
+            sinks.append(local_queue)
+        elif name == "http":
+            url = os.getenv("OUTBOX_HTTP_URL")
+            if url:
+                sinks.append(HttpSink(url))
+            else:
+                print("⚠️  OUTBOX_HTTP_URL не задан, HTTP-приёмник событий отключен")
+        elif name:
+            print(f"⚠️  Неизвестный приёмник событий outbox: {name}")
+    return sinks
+
+
+def serialize_event(event: models.OutboxEvent) -> dict:
+    return {
+        "id": event.id,
+        "aggregate_type": event.aggregate_type,
+        "aggregate_id": event.aggregate_id,
+        "event_type": event.event_type,
+        "payload": event.payload,
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+    }
+
+
+def relay_batch(db: Session, sinks: List[EventSink], batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    events = (
+        db.query(models.OutboxEvent)
+        .filter(models.OutboxEvent.published_at.is_(None))
+        .order_by(models.OutboxEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    now = datetime.now(timezone.utc)
+    metrics.last_run_at = now
+    metrics.last_batch_size = len(events)
+    if not events:
+        db.rollback()
+        return 0
+
+    batch = [serialize_event(event) for event in events]
+    try:
+        for sink in sinks:
+            sink.publish(batch)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        for event in events:
+            event.attempts = (event.attempts or 0) + 1
+            event.last_error = error
+        db.commit()
+        metrics.failed_batches += 1
+        metrics.last_error = error
+        print(f"❌ Ошибка публикации событий outbox: {error}")
+        return 0
+
+    for event in events:
+        event.attempts = (event.attempts or 0) + 1
+        event.published_at = now
+    db.commit()
+    metrics.published += len(events)
+    return len(events)
+
+
+def relay_pending(db: Session, sinks: List[EventSink], batch_size: int = OUTBOX_BATCH_SIZE, max_batches: int = 10) -> int:
+    total = 0
+    for _ in range(max_batches):
+        published = relay_batch(db, sinks, batch_size)
+        total += published
+        if published < batch_size:
+            break
+    return total
+
+
+def get_outbox_stats(db: Session) -> dict:
+    pending, oldest = db.query(
+        func.count(models.OutboxEvent.id),
+        func.min(models.OutboxEvent.created_at),
+    ).filter(models.OutboxEvent.published_at.is_(None)).one()
+    lag_seconds = 0.0
+    if oldest is not None:
+        lag_seconds = max(0.0, (datetime.now(timezone.utc) - oldest).total_seconds())
+    return {
+        "pending": pending,
+        "lag_seconds": lag_seconds,
+        "max_lag_seconds": OUTBOX_MAX_LAG_SECONDS,
+        "lag_exceeded": lag_seconds > OUTBOX_MAX_LAG_SECONDS,
+        **metrics.as_dict(),
+    }
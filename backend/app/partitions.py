@@ -0,0 +1,236 @@
+import argparse
+import calendar
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+
+PARTITIONED_TABLES = ("orders", "deliveries")
+PARTITION_NAME_RE = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+ARCHIVED_COMMENT = "archived"
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_TABLESPACE = os.getenv("ARCHIVE_TABLESPACE")
+ARCHIVE_LOCK_TIMEOUT = os.getenv("ARCHIVE_LOCK_TIMEOUT", "5s")
+# Архивацию задерживают только строки в работе; cancelled и прочие ручные статусы — нет
+IN_FLIGHT_STATUSES = ("pending", "in_delivery", "assigned", "in_transit")
+IN_FLIGHT_SQL = "(" + ", ".join(f"'{status}'" for status in IN_FLIGHT_STATUSES) + ")"
+SWEEP_LOOKBACK_DAYS = int(os.getenv("SWEEP_LOOKBACK_DAYS", "7"))
+STRAGGLER_SWEEP_INTERVAL = float(os.getenv("STRAGGLER_SWEEP_INTERVAL", "300"))
+# Нижняя граница полного прохода: заказы старше окна тоже доходят до конца
+FULL_SWEEP_LOWER_BOUND = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    # 31 марта минус месяц — 28/29 февраля, а не ValueError
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_y{start.year:04d}m{start.month:02d}"
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    return bool(conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace"
+        ),
+        {"table": table},
+    ).scalar())
+
+
+def list_partitions(conn: Connection, table: str) -> List[str]:
+    return list(conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :table ORDER BY child.relname"
+        ),
+        {"table": table},
+    ).scalars())
+
+
+def create_month_partition(conn: Connection, table: str, start: datetime) -> str:
+    name = partition_name(table, start)
+    end = add_months(start, 1)
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return name
+
+
+def ensure_partitions(conn: Connection, months_ahead: int = PARTITION_MONTHS_AHEAD, since: Optional[datetime] = None) -> List[str]:
+    now = datetime.now(timezone.utc)
+    first = month_start(since or add_months(month_start(now), -1))
+    last = add_months(month_start(now), months_ahead)
+    created = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(conn, table):
+            continue
+        existing = set(list_partitions(conn, table))
+        current = first
+        while current <= last:
+            name = partition_name(table, current)
+            if name not in existing:
+                create_month_partition(conn, table, current)
+                created.append(name)
+            current = add_months(current, 1)
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+    return created
+
+
+def ensure_partitions_for_engine(engine: Engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    with engine.begin() as conn:
+        return ensure_partitions(conn, months_ahead)
+
+
+def _partition_bounds(name: str) -> Optional[Tuple[str, datetime, datetime]]:
+    match = PARTITION_NAME_RE.match(name)
+    if not match:
+        return None
+    start = datetime(int(match["year"]), int(match["month"]), 1, tzinfo=timezone.utc)
+    return match["table"], start, add_months(start, 1)
+
+
+def _is_archived(conn: Connection, name: str) -> bool:
+    comment = conn.execute(
+        text("SELECT obj_description(CAST(:name AS regclass), 'pg_class')"),
+        {"name": name},
+    ).scalar()
+    return comment == ARCHIVED_COMMENT
+
+
+def _copy_definitions(conn: Connection, source: str, target: str) -> List[str]:
+    # Индексы и ограничения строятся на копии заранее, чтобы ATTACH только привязал
+    # их к родительской таблице, не перестраивая под её блокировкой. ATTACH
+    # переиспользует индекс PRIMARY KEY только если он оформлен как ограничение.
+    renames = []
+    for constraint_name, definition in conn.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:name AS regclass) AND contype IN ('p', 'u', 'f') ORDER BY contype DESC"
+    ), {"name": source}).all():
+        conn.execute(text(f'ALTER TABLE "{target}" ADD CONSTRAINT "{constraint_name}_compact" {definition}'))
+        renames.append(f'ALTER TABLE "{{table}}" RENAME CONSTRAINT "{constraint_name}_compact" TO "{constraint_name}"')
+    for index_name, definition in conn.execute(text(
+        "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = CAST(:name AS regclass) "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)"
+    ), {"name": source}).all():
+        definition = definition.replace(f"INDEX {index_name} ON ", f'INDEX "{index_name}_compact" ON ', 1)
+        definition = re.sub(rf'ON (ONLY )?(public\.)?"?{source}"? ', f'ON "{target}" ', definition, count=1)
+        conn.execute(text(definition))
+        renames.append(f'ALTER INDEX "{index_name}_compact" RENAME TO "{index_name}"')
+    return renames
+
+
+def _compact_partition(engine: Engine, table: str, name: str, start: datetime, end: datetime, tablespace: Optional[str]):
+    # VACUUM FULL и SET TABLESPACE держат ACCESS EXCLUSIVE на всё время перезаписи.
+    # Вместо этого партиция копируется в новую таблицу, пока старая доступна на
+    # чтение, и подменяется коротким DETACH/ATTACH в той же транзакции.
+    compact = f"{name}_compact"
+    bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    check = f"{name}_bounds"
+    placement = f' TABLESPACE "{tablespace}"' if tablespace else ""
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{ARCHIVE_LOCK_TIMEOUT}'"))
+        # EXCLUSIVE не мешает чтению, но не даёт изменить строки во время копирования
+        conn.execute(text(f'LOCK TABLE "{name}" IN EXCLUSIVE MODE'))
+        if conn.execute(text(
+            f'SELECT 1 FROM "{name}" WHERE status IN {IN_FLIGHT_SQL} LIMIT 1'
+        )).scalar():
+            print(f"⚠️  Партиция {name} содержит недоставленные записи, архивация отложена")
+            return False
+        conn.execute(text(
+            f'CREATE TABLE "{compact}" (LIKE "{name}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+            f"{placement} WITH (fillfactor = 100, autovacuum_enabled = false)"
+        ))
+        conn.execute(text(f'INSERT INTO "{compact}" SELECT * FROM "{name}" ORDER BY id'))
+        # CHECK с границами партиции позволяет ATTACH не сканировать таблицу
+        conn.execute(text(
+            f'ALTER TABLE "{compact}" ADD CONSTRAINT "{check}" '
+            f"CHECK (created_at IS NOT NULL AND created_at >= '{start.isoformat()}' AND created_at < '{end.isoformat()}')"
+        ))
+        renames = _copy_definitions(conn, name, compact)
+        conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{compact}" {bounds}'))
+        conn.execute(text(f'DROP TABLE "{name}"'))
+        conn.execute(text(f'ALTER TABLE "{compact}" RENAME TO "{name}"'))
+        conn.execute(text(f'ALTER TABLE "{name}" DROP CONSTRAINT "{check}"'))
+        for statement in renames:
+            conn.execute(text(statement.format(table=name)))
+        conn.execute(text(f"COMMENT ON TABLE \"{name}\" IS '{ARCHIVED_COMMENT}'"))
+    # Обычный VACUUM не блокирует чтение и запись
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f'VACUUM (FREEZE, ANALYZE) "{name}"'))
+    return True
+
+
+def archive_partitions(engine: Engine, older_than_days: int = ARCHIVE_AFTER_DAYS, tablespace: Optional[str] = ARCHIVE_TABLESPACE) -> List[str]:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    candidates = []
+    with engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(conn, table):
+                print(f"⚠️  Таблица {table} не партиционирована, архивация пропущена")
+                continue
+            for name in list_partitions(conn, table):
+                bounds = _partition_bounds(name)
+                if not bounds or bounds[2] > cutoff or _is_archived(conn, name):
+                    continue
+                candidates.append(bounds + (name,))
+        conn.rollback()
+
+    archived = []
+    for table, start, end, name in candidates:
+        try:
+            if _compact_partition(engine, table, name, start, end, tablespace):
+                archived.append(name)
+                print(f"🗄️  Партиция {name} перенесена в архив")
+        except Exception as e:
+            print(f"❌ Не удалось заархивировать партицию {name}, повтор при следующем запуске: {e}")
+    return archived
+
+
+def sweep_lower_bound(now: datetime) -> datetime:
+    return now - timedelta(days=SWEEP_LOOKBACK_DAYS)
+
+
+def main():
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Обслуживание партиций orders/deliveries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = subparsers.add_parser("ensure", help="создать недостающие месячные партиции")
+    ensure_parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    archive_parser = subparsers.add_parser("archive", help="перенести старые доставленные партиции в архив")
+    archive_parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    archive_parser.add_argument("--tablespace", default=ARCHIVE_TABLESPACE)
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        created = ensure_partitions_for_engine(engine, args.months_ahead)
+        print(f"✅ Создано партиций: {len(created)}")
+    else:
+        archived = archive_partitions(engine, args.older_than_days, args.tablespace)
+        print(f"✅ Заархивировано партиций: {len(archived)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import asyncio
+import ipaddress
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.database import POOL_SIZE, MAX_OVERFLOW
+
+
+EXEMPT_PATHS = ("/", "/health", "/docs", "/redoc", "/openapi.json")
+REDIS_WARNING_INTERVAL = 30.0
+
+
+@dataclass(frozen=True)
+class RateRule:
+    path_prefix: str
+    rate: float
+    burst: int
+    method: Optional[str] = None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method and self.method != method:
+            return False
+        return path.startswith(self.path_prefix)
+
+
+DEFAULT_RULES: List[RateRule] = [
+    RateRule("/auth/login", rate=0.2, burst=5, method="POST"),
+    RateRule("/auth/register", rate=0.1, burst=3, method="POST"),
+    RateRule("/orders/my", rate=1.0, burst=5, method="GET"),
+    RateRule("/orders/", rate=5.0, burst=20),
+    RateRule("/deliveries/", rate=5.0, burst=20),
+    RateRule("/", rate=10.0, burst=40),
+]
+
+
+class BucketStore(ABC):
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        ...
+
+
+class InMemoryBucketStore(BucketStore):
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # Порядок словаря — порядок последнего обращения, вытеснение за O(1)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (cost - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+# Общее хранилище вёдер для нескольких процессов. Принимает асинхронный клиент
+# с методом eval(script, numkeys, *keys_and_args) (redis.asyncio и совместимые),
+# поэтому redis остаётся необязательной зависимостью.
+class RedisBucketStore(BucketStore):
+    _SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or ARGV[2])
+local updated = tonumber(redis.call('HGET', KEYS[1], 'u') or ARGV[3])
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._last_warning = 0.0
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        try:
+            allowed, tokens = await self.client.eval(
+                self._SCRIPT, 1, self.prefix + key, rate, burst, time.time(), cost
+            )
+        except Exception as e:
+            # Недоступный Redis не должен превращать каждый запрос в 500: пропускаем
+            if time.monotonic() - self._last_warning > REDIS_WARNING_INTERVAL:
+                self._last_warning = time.monotonic()
+                print(f"⚠️  Redis для лимитов запросов недоступен, лимиты не применяются: {e}")
+            return True, 0.0
+        if int(allowed):
+            return True, 0.0
+        return False, (cost - float(tokens)) / rate
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, max_waiting: int, wait_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.shed_count = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def acquire(self) -> bool:
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.shed_count += 1
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.shed_count += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._get_semaphore().release()
+
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_trusted_proxies(value: str) -> List[Network]:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+
+TRUSTED_PROXIES = parse_trusted_proxies(os.getenv("TRUSTED_PROXIES", ""))
+
+
+def _is_trusted(host: str, trusted: List[Network]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted)
+
+
+def client_ip(request: Request, trusted: List[Network] = TRUSTED_PROXIES) -> str:
+    # X-Forwarded-For подделывается клиентом, поэтому учитывается только за доверенным
+    # прокси: идём справа налево и берём первый адрес, не принадлежащий прокси.
+    host = request.client.host if request.client else "unknown"
+    if not trusted or not _is_trusted(host, trusted):
+        return host
+    forwarded = [item.strip() for item in request.headers.get("x-forwarded-for", "").split(",") if item.strip()]
+    for address in reversed(forwarded):
+        if not _is_trusted(address, trusted):
+            return address
+    return forwarded[0] if forwarded else host
+
+
+def get_client_identity(request: Request, secret_key: str, algorithm: str) -> str:
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], secret_key, algorithms=[algorithm])
+            if payload.get("sub"):
+                return f"user:{payload['sub']}"
+        except JWTError:
+            pass
+    return f"ip:{client_ip(request)}"
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    def __init__(
+        self,
+        app,
+        secret_key: str,
+        algorithm: str = "HS256",
+        rules: Optional[List[RateRule]] = None,
+        store: Optional[BucketStore] = None,
+        admission: Optional[AdmissionController] = None,
+        exempt_prefixes: Tuple[str, ...] = (),
+    ):
+        super().__init__(app)
+        self.exempt_prefixes = exempt_prefixes
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.store = store or InMemoryBucketStore()
+        self.admission = admission
+
+    def _match_rule(self, method: str, path: str) -> Optional[RateRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    async def dispatch(self, request: Request, call_next):
+        path = request.url.path
+        if request.method == "OPTIONS" or path in EXEMPT_PATHS or path.startswith(self.exempt_prefixes):
+            return await call_next(request)
+
+        rule = self._match_rule(request.method, path)
+        if rule:
+            identity = get_client_identity(request, self.secret_key, self.algorithm)
+            key = f"{rule.method or '*'}:{rule.path_prefix}:{identity}"
+            allowed, retry_after = await self.store.take(key, rule.rate, rule.burst)
+            if not allowed:
+                return JSONResponse(
+                    status_code=429,
+                    content={"detail": "Слишком много запросов. Повторите позже."},
+                    headers={
+                        "Retry-After": str(max(1, math.ceil(retry_after))),
+                        "X-RateLimit-Limit": str(rule.burst),
+                    },
+                )
+
+        if self.admission is None:
+            return await call_next(request)
+
+        if not await self.admission.acquire():
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Сервер перегружен. Повторите позже."},
+                headers={"Retry-After": "1"},
+            )
+        try:
+            return await call_next(request)
+        finally:
+            self.admission.release()
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+RATE_LIMIT_ENABLED = _env_flag("RATE_LIMIT_ENABLED", "true")
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(POOL_SIZE + MAX_OVERFLOW)))
+ADMISSION_MAX_WAITING = int(os.getenv("ADMISSION_MAX_WAITING", str(POOL_SIZE + MAX_OVERFLOW)))
+ADMISSION_WAIT_TIMEOUT = float(os.getenv("ADMISSION_WAIT_TIMEOUT", "2.0"))
+# Общее хранилище вёдер для нескольких воркеров; без него лимит умножается на их число
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+
+def create_admission_controller() -> AdmissionController:
+    return AdmissionController(
+        max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+        max_waiting=ADMISSION_MAX_WAITING,
+        wait_timeout=ADMISSION_WAIT_TIMEOUT,
+    )
+
+
+def create_bucket_store() -> BucketStore:
+    if not RATE_LIMIT_REDIS_URL:
+        return InMemoryBucketStore()
+    try:
+        from redis import asyncio as redis
+    except ImportError:
+        print("⚠️  RATE_LIMIT_REDIS_URL задан, но пакет redis не установлен: лимиты считаются в каждом процессе")
+        return InMemoryBucketStore()
+    return RedisBucketStore(redis.Redis.from_url(RATE_LIMIT_REDIS_URL))
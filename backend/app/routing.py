@@ -0,0 +1,215 @@
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app import eta
+
+
+MAX_TRIP_STOPS = int(os.getenv("TRIP_MAX_STOPS", "4"))
+MAX_TRIP_PAYLOAD_KG = float(os.getenv("TRIP_MAX_PAYLOAD_KG", str(eta.DRONE_MAX_PAYLOAD_KG)))
+MAX_STOP_SPACING_KM = float(os.getenv("TRIP_MAX_STOP_SPACING_KM", "3"))
+PLANNING_BUDGET_SECONDS = float(os.getenv("TRIP_PLANNING_BUDGET_SECONDS", "0.5"))
+TWO_OPT_MAX_ROUNDS = int(os.getenv("TRIP_TWO_OPT_ROUNDS", "20"))
+
+# Допустимое время доставки в минутах для значений поля delivery_time
+DELIVERY_WINDOWS = {
+    "asap": 30,
+    "30min": 30,
+    "1hour": 60,
+    "2hours": 120,
+}
+DEFAULT_WINDOW_MINUTES = 30
+
+Point = Tuple[float, float]
+
+
+@dataclass
+class Stop:
+    order_id: int
+    point: Point
+    weight: float
+    window_minutes: int
+
+
+@dataclass
+class PlannedTrip:
+    stops: List[Stop]
+    distance_km: float = 0.0
+    leg_distances_km: List[float] = field(default_factory=list)
+
+    @property
+    def order_ids(self) -> List[int]:
+        return [stop.order_id for stop in self.stops]
+
+    @property
+    def payload_kg(self) -> float:
+        return sum(stop.weight for stop in self.stops)
+
+
+def window_minutes(delivery_time: Optional[str]) -> int:
+    return DELIVERY_WINDOWS.get((delivery_time or "asap").strip().lower(), DEFAULT_WINDOW_MINUTES)
+
+
+def order_stop(order) -> Stop:
+    return Stop(
+        order_id=order.id,
+        point=eta.address_to_point(order.delivery_address),
+        weight=float(order.weight or 0),
+        window_minutes=window_minutes(order.delivery_time),
+    )
+
+
+def distance(a: Point, b: Point) -> float:
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def route_length(points: Sequence[Point], origin: Point = eta.HUB_POINT) -> float:
+    total, previous = 0.0, origin
+    for point in points:
+        total += distance(previous, point)
+        previous = point
+    return total
+
+
+def nearest_neighbour(stops: List[Stop], origin: Point = eta.HUB_POINT) -> List[Stop]:
+    remaining = list(stops)
+    route, current = [], origin
+    while remaining:
+        nearest = min(remaining, key=lambda stop: distance(current, stop.point))
+        remaining.remove(nearest)
+        route.append(nearest)
+        current = nearest.point
+    return route
+
+
+def two_opt(route: List[Stop], origin: Point = eta.HUB_POINT, deadline: Optional[float] = None) -> List[Stop]:
+    # Маршрут открытый: дрон стартует с хаба, возврат на хаб не учитывается
+    if len(route) < 3:
+        return route
+    best = list(route)
+    for _ in range(TWO_OPT_MAX_ROUNDS):
+        improved = False
+        for i in range(len(best) - 1):
+            before = best[i - 1].point if i > 0 else origin
+            for j in range(i + 1, len(best)):
+                after = best[j + 1].point if j + 1 < len(best) else None
+                old = distance(before, best[i].point) + (distance(best[j].point, after) if after else 0.0)
+                new = distance(before, best[j].point) + (distance(best[i].point, after) if after else 0.0)
+                if new + 1e-9 < old:
+                    best[i:j + 1] = reversed(best[i:j + 1])
+                    improved = True
+            if deadline is not None and time.perf_counter() > deadline:
+                return best
+        if not improved:
+            break
+    return best
+
+
+def fits_window(route: List[Stop], origin: Point = eta.HUB_POINT) -> bool:
+    elapsed, previous = 0.0, origin
+    for index, stop in enumerate(route):
+        elapsed += distance(previous, stop.point)
+        minutes = elapsed / eta.payload_speed(sum(s.weight for s in route[index:])) * 60
+        minutes += eta.HANDLING_MINUTES * (index + 1)
+        if minutes > stop.window_minutes:
+            return False
+        previous = stop.point
+    return True
+
+
+def _nearby_candidates(cells: Dict[Tuple[int, int], Dict[int, Stop]], seed: Stop, cell_size: float) -> List[Stop]:
+    # Обходим кольца ячеек вокруг seed, пока не наберём достаточно кандидатов
+    cx, cy = math.floor(seed.point[0] / cell_size), math.floor(seed.point[1] / cell_size)
+    max_ring = math.ceil(MAX_STOP_SPACING_KM / cell_size)
+    wanted = MAX_TRIP_STOPS * 4
+    candidates: List[Stop] = []
+    for ring in range(max_ring + 1):
+        for dx in range(-ring, ring + 1):
+            for dy in range(-ring, ring + 1):
+                if max(abs(dx), abs(dy)) != ring:
+                    continue
+                candidates.extend(cells.get((cx + dx, cy + dy), {}).values())
+        if len(candidates) >= wanted:
+            break
+    candidates.sort(key=lambda stop: distance(seed.point, stop.point))
+    return candidates
+
+
+def group_stops(stops: List[Stop], deadline: Optional[float] = None) -> List[List[Stop]]:
+    # Жадная кластеризация: начинаем с самой дальней точки и добавляем ближайших
+    # соседей, пока позволяют вес, число остановок и окно доставки.
+    # Размер ячейки подбирается под плотность: ~4 заказа на ячейку
+    density_cell = 2 * math.sqrt(math.pi * eta.CITY_RADIUS_KM ** 2 / max(len(stops), 1))
+    cell_size = min(max(density_cell, eta.CELL_SIZE_KM, 0.1), max(MAX_STOP_SPACING_KM, 0.1))
+    cells: Dict[Tuple[int, int], Dict[int, Stop]] = {}
+    for stop in stops:
+        cell = (math.floor(stop.point[0] / cell_size), math.floor(stop.point[1] / cell_size))
+        cells.setdefault(cell, {})[stop.order_id] = stop
+
+    def take(stop: Stop):
+        cell = (math.floor(stop.point[0] / cell_size), math.floor(stop.point[1] / cell_size))
+        del cells[cell][stop.order_id]
+
+    assigned = set()
+    groups: List[List[Stop]] = []
+    for seed in sorted(stops, key=lambda stop: -distance(eta.HUB_POINT, stop.point)):
+        if seed.order_id in assigned:
+            continue
+        assigned.add(seed.order_id)
+        take(seed)
+        group = [seed]
+        if deadline is None or time.perf_counter() < deadline:
+            payload = seed.weight
+            for stop in _nearby_candidates(cells, seed, cell_size):
+                if len(group) >= MAX_TRIP_STOPS:
+                    break
+                if distance(seed.point, stop.point) > MAX_STOP_SPACING_KM:
+                    break
+                if payload + stop.weight > MAX_TRIP_PAYLOAD_KG:
+                    continue
+                if not fits_window(nearest_neighbour(group + [stop])):
+                    continue
+                group.append(stop)
+                payload += stop.weight
+                assigned.add(stop.order_id)
+                take(stop)
+        groups.append(group)
+    return groups
+
+
+def plan_trips(orders: List, budget_seconds: float = PLANNING_BUDGET_SECONDS) -> List[PlannedTrip]:
+    deadline = time.perf_counter() + budget_seconds
+    stops = [order_stop(order) for order in orders]
+    trips = []
+    for group in group_stops(stops, deadline):
+        route = nearest_neighbour(group)
+        if time.perf_counter() < deadline:
+            improved = two_opt(route, deadline=deadline)
+            if fits_window(improved):
+                route = improved
+        trips.append(PlannedTrip(stops=route))
+    # Длины плеч берём из того же кэша по ячейкам, что и оценка /orders/{id}/eta,
+    # чтобы время рейса и прогноз для заказа считались одинаково
+    pairs = [trip_leg_cells(trip) for trip in trips]
+    distances = eta.route_distances(pair for legs in pairs for pair in legs)
+    for trip, legs in zip(trips, pairs):
+        trip.leg_distances_km = [distances[pair] for pair in legs]
+        trip.distance_km = sum(trip.leg_distances_km)
+    return trips
+
+
+def trip_leg_cells(trip: PlannedTrip) -> List[Tuple[eta.Cell, eta.Cell]]:
+    cells = [eta.point_to_cell(eta.HUB_POINT)] + [eta.point_to_cell(stop.point) for stop in trip.stops]
+    return list(zip(cells, cells[1:]))
+
+
+def trip_arrival_minutes(trip: PlannedTrip, queue_depth: int) -> Dict[int, float]:
+    wait = eta.queue_wait_minutes(queue_depth)
+    arrivals, elapsed = {}, wait
+    for index, (stop, leg) in enumerate(zip(trip.stops, trip.leg_distances_km)):
+        payload = sum(s.weight for s in trip.stops[index:])
+        elapsed += eta.flight_minutes(leg, payload)
+        arrivals[stop.order_id] = elapsed
+    return arrivals
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import List, Optional
 
 
 class UserBase(BaseModel):
@@ -92,6 +92,9 @@ class DeliveryUpdate(BaseModel):
 class DeliveryResponse(DeliveryBase):
     id: int
     status: str
+    trip_id: Optional[int] = None
+    stop_sequence: Optional[int] = None
+    promised_arrival: Optional[datetime] = None
     actual_arrival: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -113,3 +116,55 @@ class OrderResponse(OrderBase):
         from_attributes = True
 
 
+class TripResponse(BaseModel):
+    id: int
+    drone_id: str
+    status: str
+    stop_count: int
+    distance_km: Optional[Decimal] = None
+    payload_kg: Optional[Decimal] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+    deliveries: List[DeliveryResponse] = []
+    
+    class Config:
+        from_attributes = True
+
+
+class EtaResponse(BaseModel):
+    order_id: int
+    status: str
+    distance_km: float
+    queue_depth: int
+    estimated_arrival: datetime
+    minutes_remaining: float
+    source: str
+
+
+class OrderStatsRow(BaseModel):
+    hour: datetime
+    category: str
+    order_count: int
+    revenue: Decimal
+
+
+class DeliveryStatsRow(BaseModel):
+    hour: datetime
+    category: str
+    delivered_count: int
+    avg_duration_seconds: Optional[float] = None
+    on_time_rate: Optional[float] = None
+
+
+class RevenueByCategory(BaseModel):
+    category: str
+    order_count: int
+    revenue: Decimal
+
+
+class DeliverySummary(BaseModel):
+    since: datetime
+    until: datetime
+    delivered_count: int
+    avg_duration_seconds: Optional[float] = None
+    on_time_rate: Optional[float] = None
@@ -0,0 +1,205 @@
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+DEFAULT_WINDOW = timedelta(hours=24)
+
+
+def hour_bucket(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(db: Session, model, rows: List[dict], counters: Tuple[str, ...]):
+    if not rows:
+        return
+    # Сортировка ключей — единый порядок блокировок строк при параллельных транзакциях
+    rows = sorted(rows, key=lambda row: (row["hour"], row["category"]))
+    stmt = pg_insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[model.hour, model.category],
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in counters},
+    )
+    db.execute(stmt)
+
+
+def record_order_created(db: Session, order: models.Order, sign: int = 1):
+    # Бакет — час created_at заказа, как и в backfill, чтобы живые агрегаты совпадали с пересчётом
+    _upsert(db, models.OrderStatsHourly, [{
+        "hour": hour_bucket(order.created_at),
+        "category": order.category,
+        "order_count": sign,
+        "revenue": sign * Decimal(order.price or 0),
+    }], ("order_count", "revenue"))
+
+
+def record_order_deleted(db: Session, order: models.Order):
+    record_order_created(db, order, sign=-1)
+    delivery = order.delivery
+    if delivery and delivery.status == "delivered" and delivery.actual_arrival:
+        record_deliveries_completed(db, [(order, delivery)], delivery.actual_arrival, sign=-1)
+
+
+def record_deliveries_completed(db: Session, items: List[Tuple[models.Order, models.Delivery]], now: datetime, sign: int = 1):
+    totals: Dict[Tuple[datetime, str], dict] = defaultdict(lambda: {
+        "delivered_count": 0,
+        "total_duration_seconds": Decimal(0),
+        "with_eta_count": 0,
+        "on_time_count": 0,
+    })
+    for order, delivery in items:
+        arrived = delivery.actual_arrival or now
+        started = delivery.created_at or arrived
+        row = totals[(hour_bucket(arrived), order.category)]
+        row["delivered_count"] += sign
+        row["total_duration_seconds"] += sign * Decimal(max(0.0, (arrived - started).total_seconds())).quantize(Decimal("0.01"))
+        # Сравниваем с обещанной при отправке ETA: estimated_arrival у опоздавших
+        # доставок сдвигается вперёд при каждом пересчёте
+        if delivery.promised_arrival:
+            row["with_eta_count"] += sign
+            if arrived <= delivery.promised_arrival:
+                row["on_time_count"] += sign
+    _upsert(
+        db,
+        models.DeliveryStatsHourly,
+        [{"hour": hour, "category": category, **row} for (hour, category), row in totals.items()],
+        ("delivered_count", "total_duration_seconds", "with_eta_count", "on_time_count"),
+    )
+
+
+def _window(since: Optional[datetime], until: Optional[datetime]) -> Tuple[datetime, datetime]:
+    until = until or datetime.now(timezone.utc)
+    since = since or until - DEFAULT_WINDOW
+    return hour_bucket(since), until
+
+
+def get_orders_hourly(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+    since, until = _window(since, until)
+    rows = db.scalars(
+        select(models.OrderStatsHourly)
+        .where(models.OrderStatsHourly.hour >= since, models.OrderStatsHourly.hour <= until)
+        .order_by(models.OrderStatsHourly.hour, models.OrderStatsHourly.category)
+    ).all()
+    return [
+        {"hour": row.hour, "category": row.category, "order_count": row.order_count, "revenue": row.revenue}
+        for row in rows
+    ]
+
+
+def get_deliveries_hourly(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+    since, until = _window(since, until)
+    rows = db.scalars(
+        select(models.DeliveryStatsHourly)
+        .where(models.DeliveryStatsHourly.hour >= since, models.DeliveryStatsHourly.hour <= until)
+        .order_by(models.DeliveryStatsHourly.hour, models.DeliveryStatsHourly.category)
+    ).all()
+    return [
+        {
+            "hour": row.hour,
+            "category": row.category,
+            "delivered_count": row.delivered_count,
+            "avg_duration_seconds": float(row.total_duration_seconds) / row.delivered_count if row.delivered_count else None,
+            "on_time_rate": row.on_time_count / row.with_eta_count if row.with_eta_count else None,
+        }
+        for row in rows
+    ]
+
+
+def get_revenue_by_category(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+    since, until = _window(since, until)
+    rows = db.execute(
+        select(
+            models.OrderStatsHourly.category,
+            func.sum(models.OrderStatsHourly.order_count),
+            func.sum(models.OrderStatsHourly.revenue),
+        )
+        .where(models.OrderStatsHourly.hour >= since, models.OrderStatsHourly.hour <= until)
+        .group_by(models.OrderStatsHourly.category)
+        .order_by(func.sum(models.OrderStatsHourly.revenue).desc())
+    ).all()
+    return [
+        {"category": category, "order_count": int(order_count), "revenue": revenue}
+        for category, order_count, revenue in rows
+    ]
+
+
+def get_on_time_summary(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> dict:
+    since, until = _window(since, until)
+    delivered, duration, with_eta, on_time = db.execute(
+        select(
+            func.coalesce(func.sum(models.DeliveryStatsHourly.delivered_count), 0),
+            func.coalesce(func.sum(models.DeliveryStatsHourly.total_duration_seconds), 0),
+            func.coalesce(func.sum(models.DeliveryStatsHourly.with_eta_count), 0),
+            func.coalesce(func.sum(models.DeliveryStatsHourly.on_time_count), 0),
+        )
+        .where(models.DeliveryStatsHourly.hour >= since, models.DeliveryStatsHourly.hour <= until)
+    ).one()
+    return {
+        "since": since,
+        "until": until,
+        "delivered_count": int(delivered),
+        "avg_duration_seconds": float(duration) / int(delivered) if delivered else None,
+        "on_time_rate": int(on_time) / int(with_eta) if with_eta else None,
+    }
+
+
+BACKFILL_SQL = (
+    "LOCK TABLE stats_orders_hourly, stats_deliveries_hourly IN EXCLUSIVE MODE",
+    "TRUNCATE stats_orders_hourly, stats_deliveries_hourly",
+    """
+    INSERT INTO stats_orders_hourly (hour, category, order_count, revenue)
+    SELECT date_trunc('hour', created_at), category, count(*), coalesce(sum(price), 0)
+    FROM orders
+    GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO stats_deliveries_hourly
+        (hour, category, delivered_count, total_duration_seconds, with_eta_count, on_time_count)
+    SELECT
+        date_trunc('hour', d.actual_arrival),
+        o.category,
+        count(*),
+        coalesce(sum(greatest(extract(epoch FROM d.actual_arrival - d.created_at), 0)), 0),
+        count(d.promised_arrival),
+        count(*) FILTER (WHERE d.actual_arrival <= d.promised_arrival)
+    FROM deliveries d
+    JOIN orders o ON o.id = d.order_id
+    WHERE d.status = 'delivered' AND d.actual_arrival IS NOT NULL
+    GROUP BY 1, 2
+    """,
+)
+
+
+def backfill(engine: Engine):
+    # date_trunc работает в часовом поясе сессии, а бакеты считаются в UTC
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+        for statement in BACKFILL_SQL:
+            conn.execute(text(statement))
+
+
+def main():
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Обслуживание агрегатов статистики")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backfill", help="пересчитать агрегаты по всей истории заказов")
+    parser.parse_args()
+
+    backfill(engine)
+    print("✅ Агрегаты статистики пересчитаны")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import desc, func, text
+from sqlalchemy.orm import Session
+
+from app import crud, models
+
+
+# Прежние реализации горячих запросов через Query, для сравнения
+def legacy_get_user_by_email(db: Session, email: str):
+    return db.query(models.User).filter(func.lower(models.User.email) == crud.normalize_email(email)).first()
+
+
+def legacy_get_order_row(db: Session, order_id: int):
+    return db.query(models.Order).filter(models.Order.id == order_id).first()
+
+
+def legacy_get_delivery_by_order(db: Session, order_id: int):
+    return db.query(models.Delivery).filter(models.Delivery.order_id == order_id).first()
+
+
+def legacy_get_orders_by_user(db: Session, user_id: int):
+    return db.query(models.Order).filter(models.Order.user_id == user_id).order_by(desc(models.Order.created_at)).offset(0).limit(100).all()
+
+
+def legacy_select_due_orders(db: Session, status: str, since: datetime, until: datetime):
+    return db.query(models.Order).filter(
+        models.Order.status == status,
+        models.Order.created_at >= since,
+        models.Order.created_at <= until
+    ).with_for_update(skip_locked=True).all()
+
+
+def cases(now: datetime):
+    since, until = now - timedelta(days=7), now - timedelta(minutes=1)
+    return [
+        ("get_user_by_email",
+         lambda db, i: legacy_get_user_by_email(db, f"user{i}@example.com"),
+         lambda db, i: crud.get_user_by_email(db, f"user{i}@example.com")),
+        ("get_order",
+         lambda db, i: legacy_get_order_row(db, i),
+         lambda db, i: crud._select_order(db, i)),
+        ("get_delivery_by_order",
+         lambda db, i: legacy_get_delivery_by_order(db, i),
+         lambda db, i: crud.get_delivery_by_order(db, i, since)),
+        ("get_orders_by_user",
+         lambda db, i: legacy_get_orders_by_user(db, i),
+         lambda db, i: crud._select_orders_by_user(db, i, 0, 100)),
+        ("sweep select",
+         lambda db, i: legacy_select_due_orders(db, "pending", since, until),
+         lambda db, i: crud._select_due_orders(db, "pending", since, until)),
+    ]
+
+
+class StatementOnlySession:
+    # Без базы: считаем только построение запроса и ключ кэша компиляции,
+    # то есть работу, которую SQLAlchemy выполняет на каждый вызов
+    def __init__(self):
+        self.session = Session()
+
+    def query(self, *entities):
+        return _StatementOnlyQuery(self.session.query(*entities))
+
+    def scalars(self, stmt):
+        stmt._generate_cache_key()
+        return _EmptyResult()
+
+    def scalar(self, stmt):
+        stmt._generate_cache_key()
+        return 0
+
+
+class _StatementOnlyQuery:
+    def __init__(self, query):
+        self.query = query
+
+    def __getattr__(self, name):
+        attr = getattr(self.query, name)
+        return lambda *args, **kwargs: _StatementOnlyQuery(attr(*args, **kwargs))
+
+    def _finish(self):
+        self.query.statement._generate_cache_key()
+
+    def first(self):
+        self._finish()
+
+    def all(self):
+        self._finish()
+        return []
+
+
+class _EmptyResult:
+    def first(self):
+        return None
+
+    def all(self):
+        return []
+
+
+def measure(fn, db, iterations: int) -> float:
+    for i in range(50):
+        fn(db, i)
+    started = time.process_time()
+    for i in range(iterations):
+        fn(db, i % 1000 + 1)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU на вызов горячих запросов crud: Query против lambda_stmt")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--offline", action="store_true", help="не обращаться к базе, мерить только построение запросов")
+    args = parser.parse_args()
+
+    db = None
+    if not args.offline:
+        from app.database import SessionLocal
+        try:
+            db = SessionLocal()
+            db.execute(text("SELECT 1"))
+        except Exception as e:
+            print(f"⚠️  База недоступна ({type(e).__name__}), измеряем без неё")
+            db = None
+    mode = "с базой" if db is not None else "без базы"
+    db = db or StatementOnlySession()
+
+    print(f"Режим: {mode}, итераций: {args.iterations}")
+    print(f"{'запрос':<24} | {'Query, мкс':>11} | {'lambda, мкс':>11} | {'ускорение':>9}")
+    for name, legacy, cached in cases(datetime.now(timezone.utc)):
+        before = measure(legacy, db, args.iterations)
+        after = measure(cached, db, args.iterations)
+        print(f"{name:<24} | {before:>11.1f} | {after:>11.1f} | {before / after:>8.2f}x")
+        if isinstance(db, Session):
+            db.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import eta, routing
+
+
+def synthetic_orders(count: int, seed: int):
+    rng = random.Random(seed)
+    windows = list(routing.DELIVERY_WINDOWS)
+    return [
+        SimpleNamespace(
+            id=i,
+            delivery_address=f"ул. Синтетическая, д. {rng.randint(1, count * 4)}, кв. {rng.randint(1, 200)}",
+            weight=round(rng.uniform(0.1, 2.5), 2),
+            delivery_time=rng.choice(windows),
+        )
+        for i in range(count)
+    ]
+
+
+def run(count: int, budget: float, seed: int):
+    orders = synthetic_orders(count, seed)
+    single_distance = sum(
+        routing.distance(eta.HUB_POINT, eta.address_to_point(order.delivery_address))
+        for order in orders
+    )
+    started = time.perf_counter()
+    trips = routing.plan_trips(orders, budget_seconds=budget)
+    elapsed = time.perf_counter() - started
+    planned_distance = sum(trip.distance_km for trip in trips)
+    multi_stop = sum(1 for trip in trips if len(trip.stops) > 1)
+    print(
+        f"{count:>7} | {len(trips):>7} | {len(trips) / count:>13.3f} | "
+        f"{multi_stop:>10} | {planned_distance / single_distance:>10.3f} | {elapsed * 1000:>9.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк планирования мультидроп-рейсов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--budget", type=float, default=routing.PLANNING_BUDGET_SECONDS)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"Бюджет планирования: {args.budget} с, максимум остановок: {routing.MAX_TRIP_STOPS}")
+    print(" orders |  drones | drones/order | multi-stop | dist ratio | plan, ms")
+    for size in args.sizes:
+        run(size, args.budget, args.seed)
+
+
+if __name__ == "__main__":
+    main()
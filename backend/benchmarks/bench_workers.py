@@ -0,0 +1,138 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_ready(host: str, port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("сервер не запустился")
+
+
+def _client_process(host: str, port: int, path: str, stop_at: float, threads: int) -> int:
+    counts = [0] * threads
+
+    def worker(index: int):
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        while time.time() < stop_at:
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                if response.status < 500:
+                    counts[index] += 1
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=10)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(counts)
+
+
+def load_processes(host: str, port: int, path: str, duration: float, concurrency: int, processes: int) -> float:
+    # Клиент в одном процессе упирается в GIL раньше сервера, поэтому
+    # соединения распределяются по отдельным процессам
+    processes = max(1, min(processes, concurrency))
+    stop_at = time.time() + duration
+    threads = [concurrency // processes + (1 if i < concurrency % processes else 0) for i in range(processes)]
+    with multiprocessing.Pool(processes) as pool:
+        counts = pool.starmap(_client_process, [(host, port, path, stop_at, n) for n in threads])
+    return sum(counts) / duration
+
+
+def load_wrk(host: str, port: int, path: str, duration: float, concurrency: int, processes: int) -> float:
+    output = subprocess.run(
+        ["wrk", f"-t{max(1, min(processes, concurrency))}", f"-c{concurrency}", f"-d{int(duration)}s", f"http://{host}:{port}{path}"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    match = re.search(r"Requests/sec:\s+([\d.]+)", output)
+    if not match:
+        raise RuntimeError(f"не удалось разобрать вывод wrk: {output}")
+    return float(match.group(1))
+
+
+def resolve_path(host: str, port: int, path: str) -> Optional[str]:
+    # /orders/{order_id} бьёт в БД и через middleware; id берётся из существующего заказа
+    if "{order_id}" not in path:
+        return path
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    connection.request("GET", "/orders/?limit=1")
+    response = connection.getresponse()
+    orders = json.loads(response.read() or b"[]") if response.status == 200 else []
+    if not orders:
+        return None
+    return path.replace("{order_id}", str(orders[0]["id"]))
+
+
+def run(workers: int, args) -> Dict[str, Optional[float]]:
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f"{args.host}:{args.port}", RATE_LIMIT_ENABLED="false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    load = load_wrk if args.load == "wrk" else load_processes
+    results: Dict[str, Optional[float]] = {}
+    try:
+        wait_until_ready(args.host, args.port)
+        for path in args.paths:
+            resolved = resolve_path(args.host, args.port, path)
+            if resolved is None:
+                results[path] = None
+                continue
+            load(args.host, args.port, resolved, 1.0, args.concurrency, args.clients)
+            results[path] = load(args.host, args.port, resolved, args.duration, args.concurrency, args.clients)
+        return results
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запросы в секунду в зависимости от числа воркеров")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--paths", nargs="+", default=["/health", "/orders/{order_id}"])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=multiprocessing.cpu_count(), help="число процессов-клиентов")
+    parser.add_argument("--load", choices=["processes", "wrk"], default="wrk" if shutil.which("wrk") else "processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} соединений, {args.duration} с, нагрузка: {args.load} ({args.clients} процессов)")
+    print("⚠️  Клиент и сервер делят CPU одной машины: для честных цифр запускайте нагрузку с другого хоста")
+    print("workers | " + " | ".join(f"{path:>20}" for path in args.paths))
+    for workers in args.workers:
+        results = run(workers, args)
+        cells = [f"{value:>14.0f} req/s" if value is not None else f"{'нет заказов':>20}" for value in results.values()]
+        print(f"{workers:>7} | " + " | ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+# Конфиг читается до preload приложения: app.database делит пул соединений на это число
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+# Приложение импортируется один раз в мастере, воркеры получают его через fork
+preload_app = True
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "45"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = 5
+accesslog = os.getenv("ACCESS_LOG")
+loglevel = os.getenv("LOG_LEVEL", "warning")
+
+if workers > 1 and not os.getenv("RATE_LIMIT_REDIS_URL"):
+    print(f"⚠️  RATE_LIMIT_REDIS_URL не задан: у каждого из {workers} воркеров свои лимиты запросов")
+
+
+def post_fork(server, worker):
+    # Соединения пула, открытые в мастере при импорте, нельзя делить между процессами
+    from app.database import engine
+    engine.dispose(close=False)
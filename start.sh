@@ -66,8 +66,17 @@ if [ -n "$EXISTING_BACKEND_PID" ]; then
     BACKEND_PID=$EXISTING_BACKEND_PID
     cd ..
 else
-    echo -e "${BLUE}🚀 Запускаю новый бэкенд...${NC}"
-    uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload --log-level error > /dev/null 2>&1 &
+    if [ "$APP_MODE" = "production" ]; then
+        WORKERS=${WEB_CONCURRENCY:-4}
+        echo -e "${BLUE}🚀 Запускаю бэкенд в production-режиме (воркеров: $WORKERS)...${NC}"
+        if [ -z "$RATE_LIMIT_REDIS_URL" ] && [ "$WORKERS" -gt 1 ]; then
+            echo -e "${YELLOW}⚠️  RATE_LIMIT_REDIS_URL не задан: лимиты запросов считаются в каждом воркере отдельно${NC}"
+        fi
+        WEB_CONCURRENCY=$WORKERS gunicorn app.main:app -c gunicorn.conf.py > /dev/null 2>&1 &
+    else
+        echo -e "${BLUE}🚀 Запускаю новый бэкенд...${NC}"
+        uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload --log-level error > /dev/null 2>&1 &
+    fi
     BACKEND_PID=$!
     cd ..
     